@@ -0,0 +1,247 @@
+# App/asgi.py
+"""
+ASGI entry point: the same app (App/main.py) served from an event loop.
+
+Run with any ASGI server, e.g. (from the project root):
+    uvicorn App.asgi:application --host 0.0.0.0 --port 5000
+
+Connections, request bodies and responses are handled on the event loop, so
+a slow client or a large upload never ties up a thread. All blocking work
+(encoding, CatBoost inference, which releases the GIL, and SQLite) runs in
+thread pools:
+  * Prediction POSTs (single games, batches, sweeps, searches) go to a
+    bounded inference pool with one thread per core. Admission control caps the requests
+    running or waiting for it; beyond that cap, requests are answered at
+    once with 503 and a Retry-After header instead of queueing without bound.
+  * Other requests (landing page, history, metrics, and admin requests,
+    POSTs included) go to a small separate pool without admission control,
+    so they stay responsive under inference overload.
+
+The single-game endpoints parse JSON on the loop and call the shared
+main.serve_single_game; every other route runs through the Flask app
+unchanged, via a minimal WSGI bridge. gunicorn + App.main:app keeps working.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import main, metrics
+
+# --- Configuration ---
+INFERENCE_THREADS = int(os.environ.get('ASGI_INFERENCE_THREADS', str(os.cpu_count() or 1)))
+# Requests allowed to run or wait for an inference thread; more are rejected with 503
+MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', str(INFERENCE_THREADS * 4)))
+RETRY_AFTER_SECONDS = int(os.environ.get('ASGI_RETRY_AFTER', '1'))
+AUX_THREADS = int(os.environ.get('ASGI_AUX_THREADS', '4'))
+MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', str(32 * 1024 * 1024)))
+# POST routes that do no inference: served from the aux pool, never rejected by admission control
+AUX_POST_PREFIXES = ('/admin/',)
+
+# Single-game routes served natively: path -> (endpoint name, response kind, targets)
+SINGLE_GAME_ROUTES = {
+    '/predict_copies_sold': ("predict_copies_sold", "copies_sold", ["copies_sold"]),
+    '/predict_all': ("predict_all", "all", list(main.MODEL_TARGETS)),
+    **{f'/predict/{target}': ("predict_target", "target", [target]) for target in main.MODEL_TARGETS}
+}
+
+
+class AdmissionControl:
+    """Counts admitted requests; used only from the event loop thread, so it needs no lock."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_admit(self) -> bool:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.pending -= 1
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "max_pending": self.max_pending,
+                "admitted": self.admitted, "rejected": self.rejected}
+
+
+INFERENCE_POOL = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+AUX_POOL = ThreadPoolExecutor(max_workers=AUX_THREADS, thread_name_prefix="asgi-aux")
+ADMISSION = AdmissionControl(MAX_PENDING)
+
+def admission_gauges() -> dict:
+    return {
+        "api_asgi_pending_requests": ("Requests running or waiting for an inference thread.", ADMISSION.pending),
+        "api_asgi_rejected_requests": ("Requests rejected with 503 by admission control since startup.", ADMISSION.rejected)
+    }
+
+metrics.GAUGE_PROVIDERS.append(admission_gauges)
+
+
+# --- Helpers ---
+
+def json_body(payload) -> bytes:
+    # Same output as Flask's jsonify outside debug mode
+    return (json.dumps(payload, sort_keys=True, separators=(",", ":")) + "\n").encode('utf-8')
+
+async def read_body(receive) -> bytes:
+    """Reads the whole request body; None if it exceeds MAX_BODY_BYTES."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+async def send_response(send, status: int, headers: list, body: bytes):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+def json_headers(body: bytes, extra: list = ()) -> list:
+    return [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list(extra)
+
+def is_json_request(scope) -> bool:
+    """Same test as Flask's request.is_json."""
+    for key, value in scope["headers"]:
+        if key == b"content-type":
+            mimetype = value.decode('latin-1').split(';', 1)[0].strip().lower()
+            return mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+    return False
+
+
+# --- WSGI bridge for the Flask routes ---
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode('latin-1'),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for key, value in scope["headers"]:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            name = "HTTP_" + name
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+def call_wsgi(environ: dict) -> tuple:
+    """Runs the Flask app on one request; returns (status, headers, body)."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = main.app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], body
+
+
+# --- Request handling ---
+
+def run_single_game(kind: str, targets: list, raw_input_data) -> tuple:
+    with main.app.app_context(): # For get_db() when logging synchronously
+        return main.serve_single_game(kind, targets, raw_input_data)
+
+async def handle_single_game(scope, body: bytes, route: tuple) -> tuple:
+    """Parses the body on the loop and predicts in the inference pool; returns (status, response body)."""
+    _, kind, targets = route
+    if not is_json_request(scope):
+        return 400, json_body({"error": "Request must be JSON"})
+    try:
+        with metrics.STAGE_SECONDS.time("parse", "all"):
+            raw_input_data = json.loads(body)
+    except ValueError as e:
+        return 400, json_body({"error": f"Failed to decode JSON object: {e}"})
+    loop = asyncio.get_running_loop()
+    payload, status = await loop.run_in_executor(INFERENCE_POOL, run_single_game, kind, targets, raw_input_data)
+    return status, json_body(payload)
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                INFERENCE_POOL.shutdown(wait=True)
+                AUX_POOL.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    start = time.perf_counter()
+    route = SINGLE_GAME_ROUTES.get(scope["path"]) if scope["method"] == "POST" else None
+    endpoint = route[0] if route else "asgi_bridge"
+    try:
+        body = await read_body(receive)
+    except ConnectionError:
+        return
+    if body is None:
+        response = json_body({"error": f"Request body larger than {MAX_BODY_BYTES} bytes."})
+        await send_response(send, 413, json_headers(response), response)
+        return
+    loop = asyncio.get_running_loop()
+
+    if scope["method"] != "POST" or scope["path"].startswith(AUX_POST_PREFIXES):
+        status, headers, response = await loop.run_in_executor(AUX_POOL, call_wsgi, wsgi_environ(scope, body))
+        await send_response(send, status, headers, response)
+        return
+
+    if not ADMISSION.try_admit():
+        metrics.ERRORS.inc(endpoint, "503")
+        response = json_body({"error": "Server overloaded, retry later."})
+        await send_response(send, 503, json_headers(response, [(b"retry-after", str(RETRY_AFTER_SECONDS).encode())]),
+                            response)
+        return
+    try:
+        if route:
+            status, response = await handle_single_game(scope, body, route)
+            headers = json_headers(response)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+            if status >= 400:
+                metrics.ERRORS.inc(endpoint, str(status))
+        else:
+            # Flask's own hooks record the metrics of bridged requests
+            status, headers, response = await loop.run_in_executor(INFERENCE_POOL, call_wsgi, wsgi_environ(scope, body))
+    finally:
+        ADMISSION.release()
+    await send_response(send, status, headers, response)
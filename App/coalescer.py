@@ -0,0 +1,138 @@
+# App/coalescer.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+class PredictionCoalescer:
+    """
+    Micro-batches concurrent single-row predictions into one model call.
+
+    Request threads submit an encoded feature row and block on a Future.
+    A dispatcher thread takes the first waiting row, keeps collecting rows
+    until 'max_batch' rows are waiting or 'max_wait' seconds have passed,
+    stacks them into one matrix and scores it with a single 'predict_fn'
+    call. Each caller then receives the value for its own row.
+
+    Rows may carry a 'context' (e.g. the model registry entry the request
+    started with); rows with different contexts are scored in separate
+    calls, so a request never gets a value from a model swapped in after it began.
+    """
+
+    def __init__(self, predict_fn, max_batch: int = 64, max_wait: float = 0.002, name: str = "coalescer"):
+        self.predict_fn = predict_fn # Takes (matrix of N rows, context), returns N values
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Starts the dispatcher thread (again, if this process was forked from the one that started it)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, row: np.ndarray, context=None) -> Future:
+        """Queues one encoded feature row; the Future resolves to its prediction."""
+        if self._pid != os.getpid():
+            self.start()
+        future = Future()
+        self._queue.put((np.asarray(row, dtype=np.float64).reshape(-1), context, future))
+        return future
+
+    def predict(self, row: np.ndarray, context=None) -> float:
+        """Scores one encoded feature row, blocking until its batch has run."""
+        return self.submit(row, context).result()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0
+        }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                self._score(group)
+
+    def _score(self, batch: list):
+        try:
+            predictions = self.predict_fn(np.vstack([row for row, _, _ in batch]), batch[0][1])
+            self.batches += 1
+            self.rows += len(batch)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), value in zip(batch, predictions):
+            future.set_result(float(value))
+
+
+if __name__ == '__main__':
+    # Latency/throughput comparison of direct vs coalesced predict calls
+    # with the shipped Copies Sold model. Run from the project root: python -m App.coalescer
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from .model_loader import load_model, load_all_metadata
+    from .preprocessing import FeatureEncoder
+
+    model = load_model("catboost_model_Copies Sold.pkl")
+    metadata = load_all_metadata()
+    encoder = FeatureEncoder(metadata)
+    random.seed(0)
+    rows = [encoder.encode({
+        "time_to_beat": random.uniform(1, 200), "price": random.uniform(0, 60),
+        "followers": random.randint(0, 10**6), "engagement_ratio": random.uniform(0, 5),
+        "selected_tags": random.sample(metadata['tags'][1:], 5),
+        "selected_genres": random.sample(metadata['genres'][1:], 2),
+        "selected_publisher": random.choice(metadata['publishers'][1:])
+    })[0] for _ in range(2000)]
+
+    coalescer = PredictionCoalescer(lambda matrix, _: model.predict(matrix))
+    modes = {
+        "direct": lambda row: float(model.predict(row.reshape(1, -1))[0]),
+        "coalesced": coalescer.predict
+    }
+
+    for clients in (1, 16, 128):
+        for mode, fn in modes.items():
+            latencies = []
+            def call(row):
+                t0 = time.perf_counter()
+                fn(row)
+                latencies.append(time.perf_counter() - t0)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                list(pool.map(call, rows))
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            print(f"clients={clients:<4} {mode:<10} {len(rows) / elapsed:8.0f} rows/s  "
+                  f"p50={latencies[len(latencies) // 2] * 1000:6.2f}ms  "
+                  f"p99={latencies[int(len(latencies) * 0.99)] * 1000:6.2f}ms")
+    print(f"Coalescer stats: {coalescer.stats()}")
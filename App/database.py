@@ -2,55 +2,739 @@
 import sqlite3
 import json
 import os
+import queue
+import threading
+import time
+import atexit
+from datetime import datetime, timedelta, timezone
 from flask import g
 
 DATABASE = 'database.db' # This path is relative to where app.py is run
 
+# --- Prediction log writer settings ---
+LOG_QUEUE_SIZE = 50000      # Max rows waiting to be written before backpressure kicks in
+LOG_BATCH_SIZE = 500        # Max rows written per transaction
+LOG_FLUSH_INTERVAL = 0.5    # Seconds a partial batch may wait before it is written
+LOG_ENQUEUE_TIMEOUT = 0.05  # Seconds a request may block on a full queue before its rows are dropped
+LOG_BATCH_ENQUEUE_TIMEOUT = 5.0 # Same for a batch request's rows, which are written in one transaction
+SQLITE_SYNCHRONOUS = 'NORMAL' # With WAL, NORMAL only fsyncs at checkpoints
+
+INSERT_PREDICTION_SQL = ("INSERT INTO predictions (timestamp, input_data, prediction, model, model_version, publisher) "
+                         "VALUES (?, ?, ?, ?, ?, ?)")
+INSERT_FEATURE_SQL = "INSERT OR IGNORE INTO prediction_features (kind, value, prediction_id) VALUES (?, ?, ?)"
+
+# Columns added after the original schema; init_db adds any that an existing database lacks
+ADDED_COLUMNS = {
+    'model': 'TEXT',
+    'model_version': 'TEXT',
+    'publisher': 'TEXT' # selected_publisher, copied out of input_data so it can be indexed
+}
+
+# Selected tags/genres/categories of each prediction, one row per value, written together with the prediction.
+# (Generated JSON columns would need SQLite 3.31+; the Docker image's Debian ships 3.27.)
+FEATURE_LIST_FIELDS = {
+    'tag': 'selected_tags',
+    'genre': 'selected_genres',
+    'category': 'selected_categories'
+}
+MIGRATION_CHUNK_SIZE = 20000 # Rows backfilled per transaction when indexing existing history
+
+HISTORY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_predictions_model ON predictions (model)", # Rows within a key stay in id order,
+    "CREATE INDEX IF NOT EXISTS idx_predictions_publisher ON predictions (publisher)", # so id-ordered pages need no sort
+    "CREATE INDEX IF NOT EXISTS idx_prediction_features_id ON prediction_features (prediction_id)" # For retention deletes
+]
+
+# --- Request connection pool settings ---
+POOL_SIZE = 8                  # Idle connections kept per worker process; 0 opens one per app context
+SQLITE_CACHE_SIZE_KB = 16384   # Page cache per connection (PRAGMA cache_size, in KiB)
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024 # Bytes of the database file read through mmap instead of read()
+SQLITE_CACHED_STATEMENTS = 128 # Prepared statements kept per connection, keyed by SQL text
+POOL_HEALTH_CHECK_AFTER = 30.0 # Seconds idle after which a connection is checked before reuse
+
+# Background writer used by log_prediction/log_predictions once start_log_writer() has been called
+LOG_WRITER = None
+
 def get_db():
-    """Connects to the specified database."""
+    """Returns this app context's database connection, checked out of DB_POOL on first use."""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row # This allows us to access columns by name
+        db = g._database = DB_POOL.acquire()
     return db
 
 def close_connection(exception):
-    """Closes the database connection when the application context ends."""
-    db = getattr(g, '_database', None)
+    """Returns the app context's connection to the pool when the application context ends."""
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        DB_POOL.release(db, discard=isinstance(exception, sqlite3.Error))
+
+def configure_connection(conn):
+    """Applies the journal and sync settings used by every writer connection."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Per-process pool of the connections request handlers use through get_db().
+
+    A connection is opened once (WAL, page cache and mmap settings applied,
+    statement cache enabled) and handed to one thread at a time, so it is
+    safe to share between the threads of a worker; requests reuse it and
+    the statements it has already prepared. Up to 'size' idle connections
+    are kept, most recently used first; extra ones are closed on release.
+
+    A connection idle for more than 'health_check_after' seconds runs a
+    trivial query before it is handed out and is replaced if that fails.
+    Connections released after an SQLite error, or with a transaction that
+    cannot be rolled back, are closed instead of pooled.
+
+    Like PredictionLogWriter, the pool notices when it is used from a forked
+    child and starts over there. Inherited connections are set aside, never
+    closed: closing them in the child could checkpoint and remove the WAL
+    files under the parent.
+    """
+
+    def __init__(self, database: str = None, size: int = POOL_SIZE,
+                 health_check_after: float = POOL_HEALTH_CHECK_AFTER):
+        self.database = database # None: the module's DATABASE at connect time
+        self.size = size
+        self.health_check_after = health_check_after
+        self.opened = 0
+        self.reused = 0
+        self.recycled = 0
+        self._idle = [] # (connection, released at), most recently released last
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._inherited = []
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database or DATABASE, check_same_thread=False,
+                               cached_statements=SQLITE_CACHED_STATEMENTS)
+        try:
+            configure_connection(conn)
+            conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+            conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        conn.row_factory = sqlite3.Row # This allows us to access columns by name
+        self.opened += 1
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """Checks out a healthy connection, opening one if none is idle."""
+        while True:
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._inherited.extend(conn for conn, _ in self._idle)
+                    self._idle = []
+                    self._pid = os.getpid()
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            if time.monotonic() - released_at <= self.health_check_after:
+                self.reused += 1
+                return conn
+            try:
+                conn.execute("SELECT 1").fetchone()
+                self.reused += 1
+                return conn
+            except sqlite3.Error as e:
+                print(f"Recycling a pooled database connection that failed its health check: {e}")
+                self.recycled += 1
+                self._close(conn)
+        return self._connect()
+
+    def release(self, conn, discard: bool = False):
+        """Returns a connection checked out by acquire(); 'discard' closes it instead (e.g. after an SQLite error)."""
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback() # Left open by a failed request
+            except sqlite3.Error: # Also raised by a connection that was closed
+                discard = True
+        with self._lock:
+            pooled = not discard and self._pid == os.getpid() and len(self._idle) < self.size
+            if pooled:
+                self._idle.append((conn, time.monotonic()))
+        if discard:
+            self.recycled += 1
+        if not pooled:
+            self._close(conn)
+
+    def close(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "opened": self.opened,
+            "reused": self.reused,
+            "recycled": self.recycled
+        }
+
+
+DB_POOL = ConnectionPool()
+
+def init_pool(size: int = POOL_SIZE, **kwargs):
+    """Replaces DB_POOL with a pool of the given settings, closing the old one's idle connections."""
+    global DB_POOL
+    old, DB_POOL = DB_POOL, ConnectionPool(size=size, **kwargs)
+    old.close()
+    return DB_POOL
+
+def _feature_rows_sql(source: str, id_expr: str, kind: str, field: str) -> str:
+    """SELECT producing (kind, value, prediction_id) for each string in a JSON list field of 'source'."""
+    # Invalid JSON or a non-list field falls back to '{}', which yields no rows instead of an error
+    return (f"SELECT '{kind}', j.value, {id_expr} FROM json_each("
+            f"CASE WHEN json_valid({source}) AND json_type({source}, '$.{field}') = 'array' "
+            f"THEN {source} ELSE '{{}}' END, '$.{field}') AS j WHERE j.type = 'text'")
 
 def init_db():
-    """Initializes the database schema."""
+    """Initializes the database schema, migrating databases created by older versions."""
     conn = sqlite3.connect(DATABASE)
+    # Lets retention return freed pages to the OS; only takes effect on a new (or fully vacuumed) database
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    configure_connection(conn)
+    conn.isolation_level = None # Explicit transactions below
     cursor = conn.cursor()
+    # IMMEDIATE takes the write lock up front, so workers starting together migrate one at a time
+    cursor.execute("BEGIN IMMEDIATE")
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS predictions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
             input_data TEXT,
-            prediction REAL
+            prediction REAL,
+            model TEXT,
+            model_version TEXT,
+            publisher TEXT
+        )
+    ''')
+    # Databases created by older versions of the app lack the newer columns
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(predictions)")]
+    for column, column_type in ADDED_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE predictions ADD COLUMN {column} {column_type}")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_features (
+            kind TEXT NOT NULL,
+            value TEXT NOT NULL,
+            prediction_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, value, prediction_id)
+        ) WITHOUT ROWID
+    ''')
+    # Older versions filled prediction_features from an AFTER INSERT trigger, which ran json_each
+    # on every logged row; the writers now insert the rows themselves (see _insert_predictions)
+    cursor.execute("DROP TRIGGER IF EXISTS trg_predictions_features")
+    for statement in HISTORY_INDEXES:
+        cursor.execute(statement)
+
+    # Aggregates of purged rows and the periods already processed, written by App/retention.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_rollups (
+            granularity TEXT NOT NULL,
+            period TEXT NOT NULL,
+            model TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            mean REAL,
+            min REAL,
+            max REAL,
+            p50 REAL,
+            p90 REAL,
+            p99 REAL,
+            PRIMARY KEY (granularity, period, model, dimension, value)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS retention_periods (
+            granularity TEXT NOT NULL,
+            period TEXT NOT NULL,
+            raw_rows INTEGER NOT NULL,
+            rolled_up_at TEXT NOT NULL,
+            purged_at TEXT,
+            PRIMARY KEY (granularity, period)
         )
     ''')
-    conn.commit()
+
+    # Rows logged before prediction_features existed are indexed by a resumable, chunked backfill
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            target_id INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute(
+        "INSERT OR IGNORE INTO schema_migrations (name, last_id, target_id) "
+        "SELECT 'history_index', 0, COALESCE(MAX(id), 0) FROM predictions"
+    )
+    cursor.execute("COMMIT")
+
+    migrate_history(conn)
     conn.close()
     print("Database initialized or already exists.")
 
-def log_prediction(input_data: dict, prediction_value: float):
-    """Logs a prediction to the database."""
+def migrate_history(conn, chunk_size: int = MIGRATION_CHUNK_SIZE):
+    """
+    Backfills 'publisher' and prediction_features for rows logged before they
+    existed, one chunk of ids per transaction. Progress is stored in
+    schema_migrations, so an interrupted migration resumes where it stopped.
+    """
+    cursor = conn.cursor()
+    migrated = 0
+    while True:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            last_id, target_id = cursor.execute(
+                "SELECT last_id, target_id FROM schema_migrations WHERE name = 'history_index'").fetchone()
+            if last_id >= target_id:
+                cursor.execute("COMMIT")
+                break
+            upper_id = min(last_id + chunk_size, target_id)
+            cursor.execute(
+                "UPDATE predictions SET publisher = json_extract(input_data, '$.selected_publisher') "
+                "WHERE id > ? AND id <= ? AND publisher IS NULL AND json_valid(input_data) "
+                "AND json_type(input_data, '$.selected_publisher') = 'text'",
+                (last_id, upper_id)
+            )
+            for kind, field in FEATURE_LIST_FIELDS.items():
+                cursor.execute(
+                    "INSERT OR IGNORE INTO prediction_features (kind, value, prediction_id) "
+                    + _feature_rows_sql("p.input_data", "p.id", kind, field).replace(
+                        "FROM json_each(", "FROM predictions AS p, json_each(", 1)
+                    + " AND p.id > ? AND p.id <= ?",
+                    (last_id, upper_id)
+                )
+            cursor.execute("UPDATE schema_migrations SET last_id = ? WHERE name = 'history_index'", (upper_id,))
+            cursor.execute("COMMIT")
+            migrated += upper_id - last_id
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    if migrated:
+        print(f"Indexed {migrated} previously logged predictions.")
+
+def _utc_timestamp():
+    """Current UTC time in the same format as SQLite's CURRENT_TIMESTAMP."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _insert_params(timestamp, input_data, prediction_value, model_name, model_version) -> tuple:
+    """Parameters of INSERT_PREDICTION_SQL for one logged prediction."""
+    publisher = input_data.get('selected_publisher') if isinstance(input_data, dict) else None
+    return (timestamp, json.dumps(input_data), prediction_value, model_name, model_version,
+            publisher if isinstance(publisher, str) else None)
+
+def _feature_params(input_data, prediction_id: int) -> list:
+    """Parameters of INSERT_FEATURE_SQL: the string values of the input's tag/genre/category lists."""
+    if not isinstance(input_data, dict):
+        return []
+    params = []
+    for kind, field in FEATURE_LIST_FIELDS.items():
+        values = input_data.get(field)
+        if isinstance(values, list):
+            params.extend((kind, value, prediction_id) for value in values if isinstance(value, str))
+    return params
+
+def _insert_predictions(cursor, rows: list):
+    """
+    Inserts (timestamp, input_data, prediction_value, model_name, model_version)
+    rows and their prediction_features. Must run inside a transaction.
+    """
+    cursor.executemany(INSERT_PREDICTION_SQL, [_insert_params(*row) for row in rows])
+    # The transaction holds the write lock, so the rows just inserted got consecutive ids
+    first_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0] - len(rows) + 1
+    cursor.executemany(INSERT_FEATURE_SQL, [param for offset, row in enumerate(rows)
+                                            for param in _feature_params(row[1], first_id + offset)])
+
+
+class _RowQueue(queue.Queue):
+    """Queue whose size is counted in rows: a list item (one batch of rows) counts as its length."""
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.rows = 0
+
+    def _qsize(self):
+        return self.rows
+
+    def _put(self, item):
+        super()._put(item)
+        self.rows += len(item) if isinstance(item, list) else 1
+
+    def _get(self):
+        item = super()._get()
+        self.rows -= len(item) if isinstance(item, list) else 1
+        return item
+
+
+class PredictionLogWriter:
+    """
+    Writes prediction log rows from a background thread.
+
+    Request threads only put rows on a bounded queue. A dedicated thread
+    drains it and writes rows with executemany, one transaction per
+    LOG_BATCH_SIZE rows or per LOG_FLUSH_INTERVAL, whichever comes first.
+    When the queue is full, enqueue blocks for up to LOG_ENQUEUE_TIMEOUT and
+    then drops the rows, counting them in 'dropped'. An 'enqueue_timeout'
+    of None blocks until there is room instead (for offline jobs).
+
+    enqueue_batch queues rows that must be written together: they are one
+    queue item, written in a single transaction, and wait for room for up
+    to LOG_BATCH_ENQUEUE_TIMEOUT ('batch_enqueue_timeout').
+    """
+
+    _STOP = object()
+
+    def __init__(self, database: str = None, max_queue: int = LOG_QUEUE_SIZE,
+                 batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 enqueue_timeout: float = LOG_ENQUEUE_TIMEOUT,
+                 batch_enqueue_timeout: float = LOG_BATCH_ENQUEUE_TIMEOUT):
+        self.database = database or DATABASE
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.batch_enqueue_timeout = batch_enqueue_timeout
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Starts the writer thread (again, if this process was forked from the one that started it)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = _RowQueue(maxsize=self.max_queue)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, rows: list) -> bool:
+        """
+        Queues (input_data, prediction_value, model_name, model_version) rows for writing.
+
+        Returns:
+            bool: False if the queue stayed full and the rows were dropped.
+        """
+        if self._pid != os.getpid():
+            self.start()
+        timestamp = _utc_timestamp()
+        if self.enqueue_timeout is None:
+            for row in rows:
+                self._queue.put((timestamp, *row))
+            return True
+        deadline = time.monotonic() + self.enqueue_timeout
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put((timestamp, *row), timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                self.dropped += len(rows) - i
+                return False
+        return True
+
+    def enqueue_batch(self, rows: list) -> bool:
+        """
+        Queues (input_data, prediction_value, model_name, model_version) rows
+        to be written in one transaction, waiting for room in the queue.
+
+        Returns:
+            bool: False if the queue stayed full and the rows were dropped.
+        """
+        if self._pid != os.getpid():
+            self.start()
+        timestamp = _utc_timestamp()
+        try:
+            self._queue.put([(timestamp, *row) for row in rows], timeout=self.batch_enqueue_timeout)
+        except queue.Full:
+            self.dropped += len(rows)
+            return False
+        return True
+
+    def flush(self):
+        """Blocks until every row queued so far has been written."""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def stop(self):
+        """Writes any queued rows and stops the writer thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches
+        }
+
+    def _run(self):
+        conn = configure_connection(sqlite3.connect(self.database))
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get()
+            except Exception:
+                break
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                if isinstance(item, list): # A batch request's rows: one transaction of their own
+                    self._write(conn, batch)
+                    self._write(conn, item)
+                    for _ in range(len(batch) + 1):
+                        self._queue.task_done()
+                    batch = []
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(conn, batch)
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _write(self, conn, batch: list):
+        if not batch:
+            return
+        try:
+            with conn:
+                _insert_predictions(conn.cursor(), batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Error writing {len(batch)} logged predictions: {e}")
+
+
+def start_log_writer(**kwargs):
+    """Creates and starts the background log writer; later log calls only enqueue."""
+    global LOG_WRITER
+    if LOG_WRITER is None:
+        LOG_WRITER = PredictionLogWriter(**kwargs)
+        atexit.register(LOG_WRITER.stop)
+    LOG_WRITER.start()
+    return LOG_WRITER
+
+def log_prediction(input_data: dict, prediction_value: float, model_name: str = None, model_version: str = None):
+    """Logs a prediction to the database, tagged with the model (and version) that produced it."""
+    if LOG_WRITER is not None:
+        LOG_WRITER.enqueue([(input_data, prediction_value, model_name, model_version)])
+        return
     db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO predictions (input_data, prediction) VALUES (?, ?)",
-            (json.dumps(input_data), prediction_value)
-        )
+        _insert_predictions(cursor, [(_utc_timestamp(), input_data, prediction_value, model_name, model_version)])
         db.commit()
-        print(f"Prediction logged: Input={input_data}, Prediction={prediction_value}")
     except Exception as e:
         db.rollback()
         print(f"Error logging prediction: {e}")
 
+def log_predictions(rows: list) -> bool:
+    """
+    Logs many predictions to the database in a single transaction.
+
+    Args:
+        rows (list): (input_data, prediction_value, model_name, model_version) tuples.
+
+    Returns:
+        bool: False if the rows could not be logged (written, or queued for the log writer).
+    """
+    if not rows:
+        return True
+    if LOG_WRITER is not None:
+        return LOG_WRITER.enqueue_batch(rows)
+    db = get_db()
+    cursor = db.cursor()
+    timestamp = _utc_timestamp()
+    try:
+        _insert_predictions(cursor, [(timestamp, *row) for row in rows])
+        db.commit()
+        print(f"Logged {len(rows)} predictions.")
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"Error logging predictions: {e}")
+        return False
+
+# --- Prediction history queries ---
+
+HISTORY_MAX_LIMIT = 1000
+
+# Expressions for prediction_stats' group_by; feature kinds join prediction_features as 'f'
+STATS_GROUP_BY = {
+    'model': 'p.model',
+    'model_version': 'p.model_version',
+    'publisher': 'p.publisher',
+    'day': 'substr(p.timestamp, 1, 10)',
+    'hour': 'substr(p.timestamp, 1, 13)',
+    'tag': 'f.value',
+    'genre': 'f.value',
+    'category': 'f.value'
+}
+
+def _normalize_timestamp(value: str) -> str:
+    """Accepts ISO 8601 ('2024-05-01T12:00:00Z') and returns the stored 'YYYY-MM-DD HH:MM:SS' form."""
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid timestamp '{value}'; use ISO 8601, e.g. 2024-05-01 or 2024-05-01T12:00:00Z.")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+def _until_clause(value: str) -> tuple:
+    """Inclusive upper time bound: a date-only 'until' ('2024-05-01') includes that whole day."""
+    timestamp = _normalize_timestamp(value)
+    if len(value.strip()) == len('YYYY-MM-DD'):
+        next_day = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S') + timedelta(days=1)
+        return "p.timestamp < ?", next_day.strftime('%Y-%m-%d %H:%M:%S')
+    return "p.timestamp <= ?", timestamp
+
+def _history_filters(filters: dict) -> tuple:
+    """
+    WHERE clause and parameters for the history filters: model, model_version,
+    publisher, tag, genre, category (exact matches), since/until (timestamps,
+    inclusive) and before_id (keyset pagination).
+    """
+    clauses = []
+    params = []
+    for column in ('model', 'model_version', 'publisher'):
+        if filters.get(column) is not None:
+            clauses.append(f"p.{column} = ?")
+            params.append(filters[column])
+    for kind in FEATURE_LIST_FIELDS:
+        if filters.get(kind) is not None:
+            clauses.append("p.id IN (SELECT prediction_id FROM prediction_features WHERE kind = ? AND value = ?)")
+            params.extend([kind, filters[kind]])
+    if filters.get('since') is not None:
+        clauses.append("p.timestamp >= ?")
+        params.append(_normalize_timestamp(filters['since']))
+    if filters.get('until') is not None:
+        clause, timestamp = _until_clause(filters['until'])
+        clauses.append(clause)
+        params.append(timestamp)
+    if filters.get('before_id') is not None:
+        clauses.append("p.id < ?")
+        params.append(int(filters['before_id']))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def query_predictions(filters: dict, limit: int = 100) -> list:
+    """
+    Logged predictions matching 'filters' (see _history_filters), newest first.
+
+    Pages are keyed on id rather than OFFSET, so fetching the next page
+    (before_id = the last id returned) costs the same however deep it is.
+
+    Returns:
+        list: Dicts with id, timestamp, model, model_version, prediction and the parsed input_data.
+    """
+    limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+    where, params = _history_filters(filters)
+    rows = get_db().execute(
+        "SELECT p.id, p.timestamp, p.model, p.model_version, p.prediction, p.input_data "
+        f"FROM predictions AS p{where} ORDER BY p.id DESC LIMIT ?",
+        params + [limit]
+    ).fetchall()
+    results = []
+    for row in rows:
+        result = dict(row)
+        try:
+            result['input_data'] = json.loads(row['input_data'])
+        except (TypeError, ValueError):
+            pass # Returned as stored
+        results.append(result)
+    return results
+
+def prediction_stats(group_by: str, filters: dict, limit: int = 100) -> list:
+    """
+    Count and average/min/max prediction of the logged predictions matching
+    'filters', grouped by one of STATS_GROUP_BY, computed in SQL.
+
+    Returns:
+        list: Dicts with the group value (under 'group_by'), count, avg, min and max,
+              largest groups first.
+    """
+    if group_by not in STATS_GROUP_BY:
+        raise ValueError(f"Unknown group_by '{group_by}'. Available: {', '.join(STATS_GROUP_BY)}.")
+    limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+    where, params = _history_filters(filters)
+    join = ""
+    if group_by in FEATURE_LIST_FIELDS:
+        join = " JOIN prediction_features AS f ON f.prediction_id = p.id AND f.kind = ?"
+        params = [group_by] + params
+    rows = get_db().execute(
+        f"SELECT {STATS_GROUP_BY[group_by]} AS grp, COUNT(*) AS count, AVG(p.prediction) AS avg, "
+        f"MIN(p.prediction) AS min, MAX(p.prediction) AS max "
+        f"FROM predictions AS p{join}{where} GROUP BY grp ORDER BY count DESC, grp LIMIT ?",
+        params + [limit]
+    ).fetchall()
+    return [{group_by: row['grp'], 'count': row['count'], 'avg': row['avg'],
+             'min': row['min'], 'max': row['max']} for row in rows]
+
+def query_rollups(granularity: str = None, dimension: str = None, model: str = None, value: str = None,
+                  since: str = None, until: str = None, limit: int = 100) -> list:
+    """
+    Roll-ups of purged prediction log periods (see App/retention.py), newest
+    period first. 'since'/'until' bound the period name ('2024-05-01' or '2024-05-01 13').
+    """
+    limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+    clauses = []
+    params = []
+    for column, wanted in (('granularity', granularity), ('dimension', dimension), ('model', model), ('value', value)):
+        if wanted is not None:
+            clauses.append(f"{column} = ?")
+            params.append(wanted)
+    if since is not None:
+        clauses.append("period >= ?")
+        params.append(since)
+    if until is not None:
+        # Inclusive at the precision given: until='2024-05-01' includes that day's hourly periods
+        clauses.append("substr(period, 1, length(?)) <= ?")
+        params.extend([until, until])
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    rows = get_db().execute(
+        f"SELECT * FROM prediction_rollups{where} ORDER BY period DESC, count DESC LIMIT ?", params + [limit]
+    ).fetchall()
+    return [dict(row) for row in rows]
+
 if __name__ == '__main__':
     # This block is for testing database initialization directly
     # In the main app, init_db() will be called once on startup
@@ -1,20 +1,71 @@
 # App/main.py
 import os
+import hmac
+import time
+import random
+import cProfile
 import numpy as np
-from flask import Flask, request, jsonify, g
-from .model_loader import load_model, load_all_metadata
-from .preprocessing import preprocess_input
-from .database import init_db, get_db, close_connection, log_prediction
+from flask import Flask, request, jsonify, g, Response
+from .model_loader import (load_model, load_all_metadata, check_feature_layout, get_model_entry, predict_with_entry,
+                           predict_raw_with_entry, transform_predictions, MODEL_REGISTRY, MODEL_TARGETS, MODELS_DIR)
+from .preprocessing import FeatureEncoder
+from .prediction_cache import PredictionCache
+from .coalescer import PredictionCoalescer
+from .tag_search import TagSetSearch
+from .model_reload import ModelReloader, ReloadInProgress
+from . import metrics
+from .metrics import STAGE_SECONDS, PREDICTIONS
+from . import database
+from .database import (init_db, init_pool, close_connection, log_prediction, log_predictions, start_log_writer,
+                       query_predictions, prediction_stats, query_rollups, HISTORY_MAX_LIMIT)
+from .retention import RetentionTask
 
 app = Flask(__name__)
 
 # --- Configuration ---
-MODEL_COPIES_SOLD_NAME = 'catboost_model_Copies Sold.pkl'
-MODEL_PREDICTS_LOG_TRANSFORMED = True # Keep as is, adjust if needed
+# Served models and their log-transform flags are configured in model_loader.MODEL_TARGETS
+MODEL_COPIES_SOLD_NAME, MODEL_PREDICTS_LOG_TRANSFORMED = MODEL_TARGETS["copies_sold"]
+MAX_BATCH_SIZE = 10000 # Upper bound on items accepted by the batch endpoint
+MAX_SWEEP_POINTS = 250000 # Upper bound on grid points scored by the sweep endpoint
+SWEEP_BLOCK_ROWS = 10000 # Grid points encoded and scored per model call, bounding the sweep's matrix memory
+# Tag-set search: default and maximum time budget, and limits on the search size
+SEARCH_TIME_BUDGET_MS = float(os.environ.get('SEARCH_TIME_BUDGET_MS', '2000'))
+MAX_SEARCH_TIME_BUDGET_MS = float(os.environ.get('MAX_SEARCH_TIME_BUDGET_MS', '10000'))
+MAX_SEARCH_TAGS = 10
+MAX_SEARCH_BEAM_WIDTH = 100
+MAX_SEARCH_TOP_K = 50
+ASYNC_PREDICTION_LOGGING = os.environ.get('ASYNC_PREDICTION_LOGGING', '1') == '1' # Log from a background writer thread
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', '8')) # Idle SQLite connections kept per worker; 0 disables pooling
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '10000')) # 0 disables the cache
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', '300')) # Seconds
+# Micro-batch concurrent single-game predictions into one model call per window
+COALESCE_PREDICTIONS = os.environ.get('COALESCE_PREDICTIONS', '0') == '1'
+COALESCE_WINDOW_MS = float(os.environ.get('COALESCE_WINDOW_MS', '2'))
+COALESCE_MAX_BATCH = int(os.environ.get('COALESCE_MAX_BATCH', '64'))
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', '0')) # Seconds between model file checks; 0 disables
+# Admin reloads are recorded in this file and applied by every worker within MODEL_SYNC_INTERVAL seconds;
+# 0 applies them only in the worker that handled the request
+MODEL_SYNC_INTERVAL = float(os.environ.get('MODEL_SYNC_INTERVAL', '2'))
+MODEL_RELOAD_REQUESTS_FILE = os.environ.get('MODEL_RELOAD_REQUESTS_FILE', os.path.join(MODELS_DIR, 'reload_requests.json'))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') # Admin endpoints require it in the 'X-Admin-Token' header; unset disables them
+# Opt-in sampling profiler: profile this fraction of requests and keep profiles of those slower than the threshold
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '100'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# Prediction log retention: roll up and purge raw rows older than RETENTION_DAYS every RETENTION_INTERVAL seconds
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', '0')) # 0 disables; use 'python -m App.retention' instead
+RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', '30'))
+RETENTION_GRANULARITY = os.environ.get('RETENTION_GRANULARITY', 'day') # 'hour' or 'day'
+RETENTION_ARCHIVE_DIR = os.environ.get('RETENTION_ARCHIVE_DIR') # If set, purged rows are archived here, one file per month
 
 # --- Global Variables for Models and Metadata ---
 LOADED_COPIES_SOLD_MODEL = None
 LOADED_METADATA = None
+LOADED_ENCODER = None
+PREDICTION_CACHE = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+COALESCERS = {} # target -> PredictionCoalescer, filled at startup if COALESCE_PREDICTIONS is set
+MODEL_RELOADER = None
+RETENTION_TASK = None
 
 # --- Application Context Teardown ---
 app.teardown_appcontext(close_connection)
@@ -27,25 +78,185 @@ print("Initializing application (Flask 2.3+ method)...")
 # Call init_db directly here, as it doesn't strictly need app_context for connection setup
 # (it creates a new connection, runs, then closes, which is fine for schema creation)
 init_db()
+# Request handlers check connections out of a per-worker pool (opened lazily, after any fork)
+init_pool(SQLITE_POOL_SIZE)
+if ASYNC_PREDICTION_LOGGING:
+    # Requests only enqueue log rows; a background thread batches them into SQLite
+    start_log_writer()
 
 # Load metadata first, as models often depend on it
 try:
     LOADED_METADATA = load_all_metadata()
     print(f"Loaded {len(LOADED_METADATA.get('feature_columns', []))} feature columns.")
+    # Build the feature encoder once; requests reuse its precomputed column maps.
+    LOADED_ENCODER = FeatureEncoder(LOADED_METADATA, on_unknown=metrics.UNKNOWN_VALUES.inc)
 except Exception as e:
     print(f"FATAL ERROR: Could not load metadata. Exiting. {e}")
     exit(1)
 
-# Load Copies Sold model
-try:
-    LOADED_COPIES_SOLD_MODEL = load_model(MODEL_COPIES_SOLD_NAME)
-except Exception as e:
-    print(f"FATAL ERROR: Could not load model '{MODEL_COPIES_SOLD_NAME}'. Exiting. {e}")
-    exit(1)
+# Load every served model into the registry
+for target, (model_file, log_transformed) in MODEL_TARGETS.items():
+    try:
+        load_model(model_file, target=target, log_transformed=log_transformed)
+    except Exception as e:
+        print(f"FATAL ERROR: Could not load model '{model_file}'. Exiting. {e}")
+        exit(1)
+    try:
+        # The encoder writes columns in feature_columns order; the model must read them in the same order
+        check_feature_layout(get_model_entry(target)["model"], LOADED_ENCODER.feature_columns)
+    except ValueError as e:
+        print(f"FATAL ERROR: Model '{model_file}' does not match the metadata. Exiting. {e}")
+        exit(1)
+LOADED_COPIES_SOLD_MODEL = get_model_entry("copies_sold")["model"]
+
+if COALESCE_PREDICTIONS:
+    for target in MODEL_TARGETS:
+        COALESCERS[target] = PredictionCoalescer(
+            lambda matrix, entry, target=target: predict_matrix(target, matrix, entry),
+            max_batch=COALESCE_MAX_BATCH,
+            max_wait=COALESCE_WINDOW_MS / 1000.0,
+            name=f"coalescer-{target}"
+        )
+    print(f"Prediction coalescing enabled ({COALESCE_WINDOW_MS} ms window, up to {COALESCE_MAX_BATCH} rows).")
+
+# Hot reload: swap in new model artifacts on admin request or when the files change
+MODEL_RELOADER = ModelReloader(LOADED_ENCODER.feature_columns, MODEL_WATCH_INTERVAL,
+                               control_file=MODEL_RELOAD_REQUESTS_FILE if MODEL_SYNC_INTERVAL > 0 else None,
+                               sync_interval=MODEL_SYNC_INTERVAL)
+MODEL_RELOADER.start_watching()
+
+# Background retention of the prediction log; a lock file lets one worker at a time run it
+RETENTION_TASK = RetentionTask(RETENTION_INTERVAL, retention_days=RETENTION_DAYS,
+                               granularity=RETENTION_GRANULARITY, archive_dir=RETENTION_ARCHIVE_DIR)
+RETENTION_TASK.start()
 
 print("Application initialized successfully.")
 
 
+# --- Helpers ---
+
+def predict_matrix(target: str, matrix: np.ndarray, entry: dict = None) -> np.ndarray:
+    """
+    Scores an encoded feature matrix with the model registered for 'target',
+    undoing the log transform (and clipping at zero) where the model uses one.
+
+    Pass the registry 'entry' a request started with to keep scoring with that
+    model even if a reload swaps in a new one meanwhile.
+    """
+    return predict_with_entry(entry or get_model_entry(target), matrix)
+
+def predict_single(targets, raw_input: dict):
+    """
+    Predicts each of 'targets' for one raw input, going through PREDICTION_CACHE.
+
+    Cache hits skip both encoding and inference; on any miss the input is
+    encoded once and only the missing targets are scored, through the
+    target's coalescer when coalescing is enabled.
+
+    Returns:
+        tuple: (target -> prediction, target -> version of the model used)
+    """
+    # Resolve each model once so a concurrent reload can't switch models mid-request
+    entries = {target: get_model_entry(target) for target in targets}
+    try:
+        canonical_input = LOADED_ENCODER.canonical_key(raw_input)
+    except TypeError:
+        canonical_input = None # Unhashable selections: bypass the cache
+
+    results = {}
+    missing = []
+    for target in targets:
+        value = None
+        if canonical_input is not None:
+            with STAGE_SECONDS.time("cache", target):
+                value = PREDICTION_CACHE.get((target, entries[target]["version"], canonical_input))
+        if value is None:
+            missing.append(target)
+        else:
+            results[target] = value
+            PREDICTIONS.inc(target, "cache")
+
+    if missing:
+        with STAGE_SECONDS.time("preprocess", "all"):
+            processed_input = LOADED_ENCODER.encode(raw_input)
+        if COALESCERS:
+            futures = {target: COALESCERS[target].submit(processed_input[0], entries[target]) for target in missing}
+        for target in missing:
+            with STAGE_SECONDS.time("predict", target):
+                if COALESCERS:
+                    value = futures[target].result()
+                else:
+                    value = float(predict_matrix(target, processed_input, entries[target])[0])
+            results[target] = value
+            PREDICTIONS.inc(target, "model")
+            if canonical_input is not None:
+                PREDICTION_CACHE.put((target, entries[target]["version"], canonical_input), value)
+    return results, {target: entry["version"] for target, entry in entries.items()}
+
+
+def parse_sweep_axis(name: str, spec) -> np.ndarray:
+    """Turns a sweep axis spec (a list, or start/stop with num or step) into an array of values."""
+    if isinstance(spec, list):
+        if len(spec) > MAX_SWEEP_POINTS:
+            raise ValueError(f"Axis '{name}' has more than {MAX_SWEEP_POINTS} values.")
+        values = np.asarray([float(v) for v in spec], dtype=np.float64)
+    elif isinstance(spec, dict) and "start" in spec and "stop" in spec:
+        start, stop = float(spec["start"]), float(spec["stop"])
+        if "num" in spec:
+            num = int(spec["num"])
+            # Checked before np.linspace allocates the axis
+            if not 0 < num <= MAX_SWEEP_POINTS:
+                raise ValueError(f"Axis '{name}': 'num' must be between 1 and {MAX_SWEEP_POINTS}.")
+            values = np.linspace(start, stop, num)
+        elif "step" in spec:
+            step = float(spec["step"])
+            if step <= 0 or (stop - start) / step > MAX_SWEEP_POINTS:
+                raise ValueError(f"Axis '{name}': 'step' must be positive and small enough for the grid limit.")
+            values = np.arange(start, stop + step / 2, step)
+        else:
+            raise ValueError(f"Axis '{name}' needs 'num' or 'step' alongside 'start' and 'stop'.")
+    else:
+        raise ValueError(f"Axis '{name}' must be a list of values or an object with 'start', 'stop' and 'num' or 'step'.")
+    if values.size == 0:
+        raise ValueError(f"Axis '{name}' has no values.")
+    return values
+
+
+def parse_json_body():
+    """request.get_json(), timed as the 'parse' stage."""
+    with STAGE_SECONDS.time("parse", "all"):
+        return request.get_json()
+
+
+# --- Request Instrumentation ---
+
+@app.before_request
+def start_request_timer():
+    g._request_start = time.perf_counter()
+    g._profiler = None
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        g._profiler = cProfile.Profile()
+        g._profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g._request_start
+    endpoint = request.endpoint or "unmatched"
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint)
+    if response.status_code >= 400:
+        metrics.ERRORS.inc(endpoint, str(response.status_code))
+
+    profiler = g.get('_profiler')
+    if profiler is not None:
+        profiler.disable()
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}_{endpoint}_{elapsed * 1000:.0f}ms.prof")
+            profiler.dump_stats(path)
+            print(f"Slow request profiled ({elapsed * 1000:.1f} ms, {request.path}): {path}")
+    return response
+
+
 # --- API Endpoints ---
 # ... (rest of your API endpoints remain the same) ...
 
@@ -85,49 +296,495 @@ def index():
                                 "Refer to 'feature_columns.csv', 'tags_list.csv', 'genres_list.csv', 'categories_list.csv', 'publisher_list.csv' for valid values.",
                 "example_request": example_features,
                 "response": "JSON object with 'prediction_copies_sold' and 'input_data'."
+            },
+            "/predict_copies_sold/batch": {
+                "method": "POST",
+                "description": f"Predict copies sold for up to {MAX_BATCH_SIZE} games in one call.",
+                "request_body": "JSON array of objects, each in the same format as for '/predict_copies_sold'.",
+                "response": "JSON object with a 'predictions' list in request order. Each entry has either "
+                            "'prediction_copies_sold' or an 'error' for that item."
+            },
+            "/predict/<target>": {
+                "method": "POST",
+                "description": f"Predict a single target with its model. Targets: {', '.join(MODEL_TARGETS)}.",
+                "request_body": "Same JSON object as for '/predict_copies_sold'.",
+                "response": "JSON object with 'target', 'prediction' and 'input_data'."
+            },
+            "/predict_sweep": {
+                "method": "POST",
+                "description": "What-if sweep: predict one target over a grid of one or two numerical features "
+                               "(Price, Followers, time_to_beat, engagement_ratio) around a base game.",
+                "request_body": "JSON object with 'base' (same format as for '/predict_copies_sold'), an optional "
+                                "'target' (default 'copies_sold') and 'axes': {feature: [values] or "
+                                "{'start', 'stop', 'num'} or {'start', 'stop', 'step'}}, or a list of "
+                                "{'feature', 'values' or range keys} to fix the axis order.",
+                "response": "JSON object with the axis values and 'predictions' (a list for one axis, "
+                            "a nested list indexed [first axis][second axis] for two)."
+            },
+            "/optimize_tags": {
+                "method": "POST",
+                "description": "Beam search for the tag set that maximizes a target's prediction for a base game.",
+                "request_body": "JSON object with 'base' (same format as for '/predict_copies_sold') and optional "
+                                "'target' (default 'copies_sold'), 'candidate_tags' (default: every tag), "
+                                "'min_tags'/'max_tags' (default 3/5), 'beam_width' (10), 'top_k' (5), "
+                                "'time_budget_ms' and 'keep_base_tags' (false).",
+                "response": "JSON object with the 'top_k' best 'results' ({'tags', 'prediction'}), "
+                            "'base_prediction' and 'search' statistics."
+            },
+            "/predict_all": {
+                "method": "POST",
+                "description": "Predict every target for one game. The input is encoded once and shared by all models.",
+                "request_body": "Same JSON object as for '/predict_copies_sold'.",
+                "response": "JSON object with 'predictions' (target -> value) and 'input_data'."
+            },
+            "/predictions": {
+                "method": "GET",
+                "description": "Logged predictions, newest first. Admin endpoint: send the X-Admin-Token header.",
+                "query_parameters": "Optional filters: model, model_version, publisher, tag, genre, category, "
+                                    "since, until (ISO 8601). 'limit' (default 100, max 1000) and 'before_id' "
+                                    "for pagination.",
+                "response": "JSON object with 'predictions' and 'next_before_id' (pass it as 'before_id' for the next page)."
+            },
+            "/predictions/stats": {
+                "method": "GET",
+                "description": "Count and average/min/max prediction of logged predictions, grouped in SQL.",
+                "query_parameters": "'group_by': model, model_version, publisher, tag, genre, category, day or hour; "
+                                    "the same filters as '/predictions'.",
+                "response": "JSON object with 'groups', largest first."
+            },
+            "/predictions/rollups": {
+                "method": "GET",
+                "description": "Aggregates of prediction log rows purged by retention, per period.",
+                "query_parameters": "Optional: granularity (hour/day), dimension (all/publisher/genre), model, "
+                                    "value, since, until (period names such as '2024-05-01'), limit.",
+                "response": "JSON object with 'rollups': count, mean, min, max, p50, p90 and p99 per group."
             }
         },
         "model_info": f"Main Model: {MODEL_COPIES_SOLD_NAME} (predicts log-transformed copies if configured)",
+        "models": {target: entry["model_name"] for target, entry in MODEL_REGISTRY.items()},
         "loaded_feature_columns_count": len(LOADED_METADATA.get('feature_columns', [])) if LOADED_METADATA else "Not loaded",
         "notes": "Ensure your 'selected_tags', 'selected_genres', 'selected_categories', 'selected_publisher' values match the exact strings in your metadata CSVs."
     })
 
+def serve_single_game(kind: str, targets: list, raw_input_data) -> tuple:
+    """
+    Shared body of the single-game endpoints, used by the Flask views and by
+    App/asgi.py: predicts and logs 'targets' for one game.
+
+    Args:
+        kind (str): Response shape: 'copies_sold' (/predict_copies_sold),
+                    'target' (/predict/<target>) or 'all' (/predict_all).
+        targets (list): Targets to predict.
+        raw_input_data: The parsed request body.
+
+    Returns:
+        tuple: (response payload, HTTP status code)
+    """
+    # Model and metadata should already be loaded at app startup.
+    # We still check here for robustness in case of an extremely rare race condition
+    # or if startup failed silently (though we added exits for fatal errors).
+    if any(get_model_entry(t) is None for t in targets) or LOADED_METADATA is None or LOADED_ENCODER is None:
+        return {"error": "Server not fully initialized. Model or metadata missing."}, 503
+
+    try:
+        predictions, versions = predict_single(targets, raw_input_data)
+
+        if kind == "all":
+            with STAGE_SECONDS.time("log", "all"):
+                log_predictions([(raw_input_data, value, target, versions[target]) for target, value in predictions.items()])
+            return {
+                "predictions": {target: round(value, 2) for target, value in predictions.items()},
+                "input_data": raw_input_data
+            }, 200
+
+        target = targets[0]
+        prediction_value = float(predictions[target])
+        with STAGE_SECONDS.time("log", target):
+            log_prediction(raw_input_data, prediction_value, target, versions[target])
+        if kind == "copies_sold":
+            return {
+                "prediction_copies_sold": round(prediction_value, 2),
+                "input_data": raw_input_data
+            }, 200
+        return {
+            "target": target,
+            "prediction": round(prediction_value, 2),
+            "input_data": raw_input_data
+        }, 200
+    except ValueError as ve:
+        return {"error": f"Input validation/preprocessing error: {str(ve)}. Please check your input against the expected format."}, 400
+    except KeyError as ke:
+        return {"error": f"Missing or invalid key in input data: {ke}. Ensure all required numerical features and optional lists/strings for categories are present and correctly named."}, 400
+    except Exception as e:
+        return {"error": f"An unexpected server error occurred: {str(e)}"}, 500
+
 @app.route('/predict_copies_sold', methods=['POST'])
 def predict_copies_sold():
     """Endpoint for making predictions using the loaded copies sold model."""
     if not request.is_json:
         return jsonify({"error": "Request must be JSON"}), 400
 
-    raw_input_data = request.get_json()
+    payload, status = serve_single_game("copies_sold", ["copies_sold"], parse_json_body())
+    return jsonify(payload), status
 
-    # Model and metadata should already be loaded at app startup.
-    # We still check here for robustness in case of an extremely rare race condition
-    # or if startup failed silently (though we added exits for fatal errors).
-    if LOADED_COPIES_SOLD_MODEL is None or LOADED_METADATA is None:
+@app.route('/predict_copies_sold/batch', methods=['POST'])
+def predict_copies_sold_batch():
+    """Endpoint for scoring many games with a single model call."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    raw_items = parse_json_body()
+    if not isinstance(raw_items, list):
+        return jsonify({"error": "Request body must be a JSON array of game objects."}), 400
+    if len(raw_items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large: {len(raw_items)} items (maximum is {MAX_BATCH_SIZE})."}), 413
+
+    if LOADED_COPIES_SOLD_MODEL is None or LOADED_METADATA is None or LOADED_ENCODER is None:
         return jsonify({"error": "Server not fully initialized. Model or metadata missing."}), 503
 
     try:
-        processed_input_df = preprocess_input(raw_input_data, LOADED_METADATA)
-        prediction_value = LOADED_COPIES_SOLD_MODEL.predict(processed_input_df)[0]
+        # Invalid items are reported inline and left out of the matrix
+        with STAGE_SECONDS.time("preprocess_batch", "all"):
+            matrix, positions, errors = LOADED_ENCODER.encode_batch(raw_items)
 
-        if MODEL_PREDICTS_LOG_TRANSFORMED:
-            prediction_value = np.expm1(prediction_value)
-            prediction_value = max(0, prediction_value)
+        entry = get_model_entry("copies_sold")
+        with STAGE_SECONDS.time("predict_batch", "copies_sold"):
+            predictions = predict_matrix("copies_sold", matrix, entry).tolist() if positions else []
+        PREDICTIONS.inc("copies_sold", "model", amount=len(predictions))
 
-        db = get_db()
-        log_prediction(raw_input_data, float(prediction_value))
+        # Waits for room in the log writer's queue rather than dropping part of the batch
+        with STAGE_SECONDS.time("log_batch", "copies_sold"):
+            logged = log_predictions([(raw_items[i], value, "copies_sold", entry["version"])
+                                      for i, value in zip(positions, predictions)])
+
+        results = [None] * len(raw_items)
+        for i, value in zip(positions, predictions):
+            results[i] = {"index": i, "prediction_copies_sold": round(value, 2)}
+        for i, message in errors.items():
+            results[i] = {"index": i, "error": message}
 
         return jsonify({
-            "prediction_copies_sold": round(float(prediction_value), 2),
-            "input_data": raw_input_data
+            "predictions": results,
+            "count": len(raw_items),
+            "error_count": len(errors),
+            "logged": logged
         })
-    except ValueError as ve:
-        return jsonify({"error": f"Input validation/preprocessing error: {str(ve)}. Please check your input against the expected format."}), 400
-    except KeyError as ke:
-        return jsonify({"error": f"Missing or invalid key in input data: {ke}. Ensure all required numerical features and optional lists/strings for categories are present and correctly named."}), 400
     except Exception as e:
         return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
 
+@app.route('/predict/<target>', methods=['POST'])
+def predict_target(target):
+    """Endpoint for making a prediction with the model registered for 'target'."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    if target not in MODEL_TARGETS:
+        return jsonify({"error": f"Unknown target '{target}'. Available targets: {', '.join(MODEL_TARGETS)}."}), 404
+
+    payload, status = serve_single_game("target", [target], parse_json_body())
+    return jsonify(payload), status
+
+@app.route('/predict_all', methods=['POST'])
+def predict_all():
+    """Endpoint for predicting every target for one game from a single encoding."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    payload, status = serve_single_game("all", list(MODEL_TARGETS), parse_json_body())
+    return jsonify(payload), status
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the prediction cache."""
+    return jsonify(PREDICTION_CACHE.stats())
+
+HISTORY_FILTERS = ('model', 'model_version', 'publisher', 'tag', 'genre', 'category', 'since', 'until')
+
+def history_filters_from_args() -> dict:
+    """History filters given as query-string parameters."""
+    filters = {name: request.args[name] for name in HISTORY_FILTERS if name in request.args}
+    if 'before_id' in request.args:
+        filters['before_id'] = int(request.args['before_id'])
+    return filters
+
+@app.route('/predictions', methods=['GET'])
+def prediction_history():
+    """
+    Logged predictions, newest first, filtered by model, model_version,
+    publisher, tag, genre, category and a since/until time range. Paginate
+    by passing the returned 'next_before_id' as 'before_id'. With async
+    logging, the newest predictions appear once the writer has stored them.
+    Returns the logged request bodies, so it needs the admin token.
+    """
+    auth_error = admin_auth_error()
+    if auth_error is not None:
+        return auth_error
+    try:
+        limit = int(request.args.get('limit', 100))
+        filters = history_filters_from_args()
+        rows = query_predictions(filters, limit)
+        return jsonify({
+            "predictions": rows,
+            "next_before_id": rows[-1]["id"] if len(rows) == min(max(limit, 1), HISTORY_MAX_LIMIT) else None
+        })
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+@app.route('/predictions/stats', methods=['GET'])
+def prediction_history_stats():
+    """
+    Count and avg/min/max prediction of logged predictions grouped by
+    'group_by' (model, model_version, publisher, tag, genre, category, day
+    or hour), with the same filters as /predictions.
+    """
+    try:
+        group_by = request.args.get('group_by', 'model')
+        filters = history_filters_from_args()
+        return jsonify({
+            "group_by": group_by,
+            "groups": prediction_stats(group_by, filters, int(request.args.get('limit', 100)))
+        })
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+@app.route('/predictions/rollups', methods=['GET'])
+def prediction_rollups():
+    """
+    Hourly/daily aggregates (count, mean, min, max, p50/p90/p99) of prediction
+    log rows that retention has purged, per model and publisher or genre.
+    """
+    try:
+        args = {name: request.args[name] for name in ('granularity', 'dimension', 'model', 'value', 'since', 'until')
+                if name in request.args}
+        return jsonify({"rollups": query_rollups(limit=int(request.args.get('limit', 100)), **args)})
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+@app.route('/predict_sweep', methods=['POST'])
+def predict_sweep():
+    """
+    What-if endpoint: encodes the base game once, broadcasts it over a grid of
+    one or two numerical features and scores the grid in blocks of SWEEP_BLOCK_ROWS.
+    Sweeps are exploratory and are not written to the prediction log.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    body = parse_json_body()
+    if not isinstance(body, dict) or not isinstance(body.get("base"), dict) or not isinstance(body.get("axes"), (dict, list)):
+        return jsonify({"error": "Request body must be an object with a 'base' game object and 'axes'."}), 400
+    target = body.get("target", "copies_sold")
+    if target not in MODEL_TARGETS:
+        return jsonify({"error": f"Unknown target '{target}'. Available targets: {', '.join(MODEL_TARGETS)}."}), 404
+    if not 1 <= len(body["axes"]) <= 2:
+        return jsonify({"error": "'axes' must name one or two numerical features."}), 400
+
+    entry = get_model_entry(target)
+    if entry is None or LOADED_METADATA is None or LOADED_ENCODER is None:
+        return jsonify({"error": "Server not fully initialized. Model or metadata missing."}), 503
+
+    try:
+        # 'axes' is {feature: spec} or, to pin the axis order, [{"feature": ..., "values": [...] or range keys}]
+        if isinstance(body["axes"], dict):
+            axis_specs = list(body["axes"].items())
+        else:
+            axis_specs = [(a.get("feature"), a.get("values", a)) if isinstance(a, dict) else (None, None)
+                          for a in body["axes"]]
+        axes = []
+        columns = set()
+        for name, spec in axis_specs:
+            column = LOADED_ENCODER.numerical_column_index(name) # Validate the feature name up front
+            if column in columns:
+                raise ValueError(f"Feature '{name}' appears on more than one axis")
+            columns.add(column)
+            axes.append((name, parse_sweep_axis(name, spec)))
+        shape = tuple(len(values) for _, values in axes)
+        if int(np.prod(shape)) > MAX_SWEEP_POINTS:
+            return jsonify({"error": f"Grid too large: {int(np.prod(shape))} points (maximum is {MAX_SWEEP_POINTS})."}), 413
+
+        points = int(np.prod(shape))
+        predictions = np.empty(points, dtype=np.float64)
+        for start in range(0, points, SWEEP_BLOCK_ROWS):
+            stop = min(start + SWEEP_BLOCK_ROWS, points)
+            with STAGE_SECONDS.time("preprocess_sweep", "all"):
+                matrix = LOADED_ENCODER.encode_grid(body["base"], axes, start, stop)
+            with STAGE_SECONDS.time("predict_sweep", target):
+                predictions[start:stop] = predict_matrix(target, matrix, entry)
+        predictions = predictions.reshape(shape)
+
+        return jsonify({
+            "target": target,
+            "model_version": entry["version"],
+            "axes": [{"feature": name, "values": values.tolist()} for name, values in axes],
+            "predictions": np.round(predictions, 2).tolist(),
+            "base": body["base"]
+        })
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Input validation/preprocessing error: {str(e)}. Please check your input against the expected format."}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+def bounded_int(body: dict, key: str, default: int, low: int, high: int) -> int:
+    value = body.get(key, default)
+    if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+        raise ValueError(f"'{key}' must be an integer from {low} to {high}")
+    return value
+
+@app.route('/optimize_tags', methods=['POST'])
+def optimize_tags():
+    """
+    Searches for the tags that maximize a target's prediction for a base game:
+    a beam search over tag additions from a candidate pool, scoring each step
+    as one batched matrix, within a time budget. Searches are not logged.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    body = parse_json_body()
+    if not isinstance(body, dict) or not isinstance(body.get("base"), dict):
+        return jsonify({"error": "Request body must be an object with a 'base' game object."}), 400
+    target = body.get("target", "copies_sold")
+    if target not in MODEL_TARGETS:
+        return jsonify({"error": f"Unknown target '{target}'. Available targets: {', '.join(MODEL_TARGETS)}."}), 404
+
+    entry = get_model_entry(target)
+    if entry is None or LOADED_METADATA is None or LOADED_ENCODER is None:
+        return jsonify({"error": "Server not fully initialized. Model or metadata missing."}), 503
+
+    try:
+        max_tags = bounded_int(body, "max_tags", 5, 1, MAX_SEARCH_TAGS)
+        min_tags = bounded_int(body, "min_tags", min(3, max_tags), 1, max_tags)
+        beam_width = bounded_int(body, "beam_width", 10, 1, MAX_SEARCH_BEAM_WIDTH)
+        top_k = bounded_int(body, "top_k", 5, 1, MAX_SEARCH_TOP_K)
+        time_budget_ms = body.get("time_budget_ms", SEARCH_TIME_BUDGET_MS)
+        if not isinstance(time_budget_ms, (int, float)) or not 0 < time_budget_ms <= MAX_SEARCH_TIME_BUDGET_MS:
+            raise ValueError(f"'time_budget_ms' must be a number above 0 and at most {MAX_SEARCH_TIME_BUDGET_MS}")
+        pool = body.get("candidate_tags")
+        if pool is None:
+            pool = [tag for tag, column in LOADED_ENCODER.tag_index.items() if column is not None]
+        if not isinstance(pool, list) or not pool:
+            raise ValueError("'candidate_tags' must be a non-empty list of tags")
+        fixed_tags = body["base"].get("selected_tags", []) if body.get("keep_base_tags") else []
+
+        start = time.perf_counter()
+        with STAGE_SECONDS.time("search", target):
+            search = TagSetSearch(LOADED_ENCODER, lambda matrix: predict_raw_with_entry(entry, matrix),
+                                  body["base"], pool, fixed_tags)
+            outcome = search.run(min_tags, max_tags, beam_width, top_k, time_budget_ms / 1000.0)
+            base_prediction = predict_matrix(target, LOADED_ENCODER.encode(body["base"]), entry)[0]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        predictions = transform_predictions(entry, np.array([score for _, score in outcome["results"]], dtype=float))
+        return jsonify({
+            "target": target,
+            "model_version": entry["version"],
+            "results": [{"tags": tags, "prediction": round(float(value), 2)}
+                        for (tags, _), value in zip(outcome["results"], predictions)],
+            "base_prediction": round(float(base_prediction), 2),
+            "search": {
+                "candidate_pool_size": len(search.pool),
+                "tags_searched_up_to": outcome["depth"],
+                "complete": outcome["complete"],
+                "sets_scored": outcome["scored"],
+                "memo_hits": outcome["memo_hits"],
+                "elapsed_ms": round(elapsed_ms, 1)
+            },
+            "base": body["base"]
+        })
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Input validation/preprocessing error: {str(e)}. Please check your input against the expected format."}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of request/stage latency histograms and counters."""
+    cache_stats = PREDICTION_CACHE.stats()
+    gauges = {
+        "api_prediction_cache_entries": ("Entries in the prediction cache.", cache_stats["size"]),
+        "api_prediction_cache_hits": ("Prediction cache hits since startup.", cache_stats["hits"]),
+        "api_prediction_cache_misses": ("Prediction cache misses since startup.", cache_stats["misses"]),
+        "api_prediction_cache_evictions": ("Prediction cache LRU evictions since startup.", cache_stats["evictions"])
+    }
+    if database.LOG_WRITER is not None:
+        writer_stats = database.LOG_WRITER.stats()
+        gauges.update({
+            "api_log_queue_depth": ("Prediction log rows waiting to be written.", writer_stats["queued"]),
+            "api_log_rows_written": ("Prediction log rows written since startup.", writer_stats["written"]),
+            "api_log_rows_dropped": ("Prediction log rows dropped on a full queue since startup.", writer_stats["dropped"])
+        })
+    pool_stats = database.DB_POOL.stats()
+    gauges.update({
+        "api_sqlite_pool_idle_connections": ("Idle connections in this worker's SQLite pool.", pool_stats["idle"]),
+        "api_sqlite_connections_opened": ("SQLite connections opened by the pool since startup.", pool_stats["opened"]),
+        "api_sqlite_connections_recycled": ("Pooled SQLite connections closed after a failure since startup.",
+                                            pool_stats["recycled"])
+    })
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+def admin_auth_error():
+    """Error response for an admin request, or None if it may proceed."""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled. Set ADMIN_TOKEN to enable them."}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+@app.route('/admin/models', methods=['GET'])
+def admin_models():
+    """Currently served model files and versions, with their reload status."""
+    auth_error = admin_auth_error()
+    if auth_error is not None:
+        return auth_error
+    return jsonify(MODEL_RELOADER.status())
+
+@app.route('/admin/models/<target>/reload', methods=['POST'])
+def admin_reload_model(target):
+    """
+    Reloads the model for 'target' in this worker: the file is loaded and
+    scores a warm-up batch before it is swapped in. Only then is the reload
+    recorded for the other workers. The optional JSON body
+    {"model_name": "..."} switches to a different file in Trained_models/.
+    """
+    auth_error = admin_auth_error()
+    if auth_error is not None:
+        return auth_error
+    if target not in MODEL_TARGETS:
+        return jsonify({"error": f"Unknown target '{target}'. Available targets: {', '.join(MODEL_TARGETS)}."}), 404
+
+    body = request.get_json(silent=True) or {}
+    model_name = body.get("model_name")
+    if model_name is not None and (not isinstance(model_name, str) or model_name in ('', '.', '..')
+                                   or os.path.basename(model_name) != model_name
+                                   or not os.path.isfile(os.path.join(MODELS_DIR, model_name))):
+        return jsonify({"error": "'model_name' must be the name of a file in Trained_models/."}), 400
+
+    previous_version = get_model_entry(target)["version"]
+    try:
+        entry, generation = MODEL_RELOADER.request_reload(target, model_name)
+    except ReloadInProgress:
+        return jsonify({"error": f"A reload of '{target}' is already in progress."}), 409
+    except Exception as e:
+        return jsonify({"error": f"Model rejected, still serving version {previous_version}: {e}"}), 422
+    response = {
+        "status": "reloaded",
+        "target": target,
+        "model_name": entry["model_name"],
+        "version": entry["version"],
+        "previous_version": previous_version,
+        "worker_pid": os.getpid() # The worker that handled this request; the others follow (see below)
+    }
+    if generation is not None:
+        response["generation"] = generation
+        response["note"] = (f"Every worker applies this reload within {MODEL_SYNC_INTERVAL:g} s; GET /admin/models "
+                            f"shows each worker's reload_generation.")
+    return jsonify(response)
+
 if __name__ == '__main__':
     # When running directly with `python App/main.py`, the code above this block executes.
     # For `flask run`, this block is generally not used, as Flask handles the server.
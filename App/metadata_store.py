@@ -0,0 +1,176 @@
+# App/metadata_store.py
+"""
+Compiled metadata artifact.
+
+The metadata CSVs are parsed once, at build time, into one binary file
+(metadata/metadata.bin by default). It holds the lists as tuples and the
+value -> column index maps FeatureEncoder works from, so a worker loads
+everything with a single unpickle and never imports pandas.
+
+File layout:
+    magic (8 bytes) | format version (uint32) | SHA-256 of the payload (32 bytes) | pickled payload
+
+Besides the metadata, the payload records the SHA-256 of each source CSV
+and the feature layout of the models it was checked against. load_artifact
+rejects a file with another format version, a corrupt payload, or CSVs
+that changed since the build; the caller then falls back to the CSVs.
+
+Build it from the project root (the Docker build does this):
+    python -m App.metadata_store --build
+"""
+import hashlib
+import os
+import pickle
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+ARTIFACT_NAME = 'metadata.bin'
+ARTIFACT_MAGIC = b'GMMETA\x00\x00'
+ARTIFACT_FORMAT_VERSION = 1 # Bump whenever the payload layout changes
+_HEADER = struct.Struct('>8sI32s')
+
+# Metadata key -> source CSV in the metadata directory
+METADATA_FILES = {
+    'feature_columns': 'feature_columns.csv',
+    'tags': 'tags_list.csv',
+    'genres': 'genres_list.csv',
+    'categories': 'categories_list.csv',
+    'publishers': 'publisher_list.csv'
+}
+
+
+def file_digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def feature_layout_digest(feature_columns) -> str:
+    """Hash of an ordered feature column list, comparable with a model's feature_names_."""
+    return hashlib.sha256('\n'.join(map(str, feature_columns)).encode('utf-8')).hexdigest()
+
+def source_digests(metadata_dir: str) -> dict:
+    """SHA-256 of every source CSV present in 'metadata_dir'."""
+    digests = {}
+    for file_name in METADATA_FILES.values():
+        path = os.path.join(metadata_dir, file_name)
+        if os.path.exists(path):
+            digests[file_name] = file_digest(path)
+    return digests
+
+
+def write_artifact(path: str, payload: dict):
+    """Writes 'payload' atomically, so a running worker never reads a partial file."""
+    data = pickle.dumps(payload, protocol=4)
+    header = _HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT_VERSION, hashlib.sha256(data).digest())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header + data)
+    os.replace(tmp_path, path)
+
+def load_artifact(path: str, metadata_dir: str = None) -> dict:
+    """
+    Reads a compiled metadata artifact.
+
+    Args:
+        path (str): The artifact file.
+        metadata_dir (str, optional): If given, the artifact is also checked
+                                      against the CSVs found there.
+
+    Returns:
+        dict: The metadata, in the format of model_loader.load_all_metadata,
+              plus the prebuilt 'indexes' and the artifact's 'feature_layout'.
+
+    Raises:
+        FileNotFoundError: If there is no artifact.
+        ValueError: If the artifact is corrupt, from another format version,
+                    or older than the CSVs it was built from.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError("Metadata artifact is truncated.")
+    magic, version, digest = _HEADER.unpack_from(data)
+    if magic != ARTIFACT_MAGIC:
+        raise ValueError("Not a metadata artifact.")
+    if version != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Metadata artifact format {version} is not supported (expected {ARTIFACT_FORMAT_VERSION}).")
+    body = memoryview(data)[_HEADER.size:]
+    if hashlib.sha256(body).digest() != digest:
+        raise ValueError("Metadata artifact checksum mismatch.")
+    payload = pickle.loads(body)
+
+    if metadata_dir is not None:
+        for file_name, current in source_digests(metadata_dir).items():
+            if payload['sources'].get(file_name) != current:
+                raise ValueError(f"'{file_name}' changed since the metadata artifact was built.")
+
+    metadata = dict(payload['lists'])
+    metadata['indexes'] = payload['indexes']
+    metadata['feature_layout'] = payload['feature_layout']
+    return metadata
+
+
+def build_artifact(metadata_dir: str, path: str, model_targets: dict = None) -> dict:
+    """
+    Compiles the CSVs in 'metadata_dir' into the artifact at 'path'.
+
+    The feature columns are checked against every model of 'model_targets'
+    (target -> (model file, log transformed), as model_loader.MODEL_TARGETS)
+    first; a model trained on another layout aborts the build.
+
+    Returns:
+        dict: Summary of the written artifact.
+
+    Raises:
+        ValueError: If a model's feature names differ from feature_columns.csv.
+    """
+    # Build-time only: the CSV parser (pandas), models and encoder are imported here
+    from .model_loader import load_list_from_csv, load_model, resolve_model_path, model_version
+    from .preprocessing import build_indexes
+
+    lists = {key: tuple(load_list_from_csv(file_name)) for key, file_name in METADATA_FILES.items()}
+    layout = feature_layout_digest(lists['feature_columns'])
+
+    models = {}
+    for target, (model_file, _) in (model_targets or {}).items():
+        model = load_model(model_file)
+        feature_names = getattr(model, 'feature_names_', None)
+        if feature_names is not None and feature_layout_digest(feature_names) != layout:
+            raise ValueError(f"Model '{model_file}' ({target}) was trained on a different feature layout "
+                             f"than {METADATA_FILES['feature_columns']}.")
+        models[model_file] = model_version(resolve_model_path(model_file))
+
+    payload = {
+        'lists': lists,
+        'indexes': build_indexes(lists),
+        'feature_layout': layout,
+        'models': models, # Model file -> content hash of the version checked at build time
+        'sources': source_digests(metadata_dir),
+        'built_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+    }
+    write_artifact(path, payload)
+    return {
+        'path': path,
+        'bytes': os.path.getsize(path),
+        'lists': {key: len(values) for key, values in lists.items()},
+        'feature_layout': layout[:12],
+        'models': models
+    }
+
+
+if __name__ == '__main__':
+    # Build: python -m App.metadata_store --build   |   Load timing: python -m App.metadata_store
+    from .model_loader import METADATA_DIR, METADATA_ARTIFACT, MODEL_TARGETS
+
+    if '--build' in sys.argv:
+        summary = build_artifact(METADATA_DIR, METADATA_ARTIFACT, MODEL_TARGETS)
+        print(f"Wrote metadata artifact '{summary['path']}' ({summary['bytes']} bytes, "
+              f"layout {summary['feature_layout']}): {summary['lists']}")
+        sys.exit(0)
+
+    start = time.perf_counter()
+    metadata = load_artifact(METADATA_ARTIFACT, METADATA_DIR)
+    elapsed = time.perf_counter() - start
+    counts = {key: len(metadata[key]) for key in METADATA_FILES}
+    print(f"Loaded '{METADATA_ARTIFACT}' in {elapsed * 1000:.2f} ms: {counts}; pandas imported: {'pandas' in sys.modules}")
@@ -0,0 +1,135 @@
+# App/metrics.py
+"""
+In-process metrics with Prometheus text exposition.
+
+Histograms and counters are plain Python objects guarded by a lock; an
+observation costs two perf_counter() calls and a bucket bisect, so they can
+stay on the request path permanently. render() produces the text served on
+/metrics.
+"""
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from 0.1 ms to 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_text(label_names: tuple, label_values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{str(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {} # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *label_values):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, label_values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.label_names, label_values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_label_text(self.label_names, label_values)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+
+# --- Application metrics ---
+
+REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds", "End-to-end request latency by endpoint.", ("endpoint",))
+STAGE_SECONDS = Histogram(
+    "api_stage_duration_seconds", "Latency of each request stage (parse, cache, preprocess, predict, log) by model.",
+    ("stage", "model"))
+PREDICTIONS = Counter(
+    "api_predictions_total", "Predictions returned, by model and source (model or cache).", ("model", "source"))
+UNKNOWN_VALUES = Counter(
+    "api_unknown_input_values_total", "Input values not found in the metadata lists, by kind.", ("kind",))
+ERRORS = Counter(
+    "api_request_errors_total", "Requests answered with an error status, by endpoint and status.", ("endpoint", "status"))
+
+ALL_METRICS = [REQUEST_SECONDS, STAGE_SECONDS, PREDICTIONS, UNKNOWN_VALUES, ERRORS]
+
+# Callables returning extra gauges (name -> (help text, value)) for render(), e.g. from the ASGI server
+GAUGE_PROVIDERS = []
+
+
+def render(gauges: dict = None) -> str:
+    """
+    Prometheus text for every registered metric, plus 'gauges': a dict of
+    metric name -> (help text, value) for point-in-time values.
+    """
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    gauges = dict(gauges or {})
+    for provider in GAUGE_PROVIDERS:
+        gauges.update(provider())
+    for name, (documentation, value) in gauges.items():
+        lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return '\n'.join(lines) + '\n'
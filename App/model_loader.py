@@ -1,27 +1,65 @@
 # App/model_loader.py
 import joblib
 import os
-import pandas as pd # Needed for reading CSVs
-# If your CatBoost models are stored as .cbm files and loaded using catboost.CatBoostRegressor.load_model,
-# you'd import CatBoost here. But joblib.load typically works for .pkl files.
-# from catboost import CatBoostRegressor # Uncomment if models are CatBoost objects saved directly
+import sys
+import time
+import hashlib
+import numpy as np
+# pandas (CSV parsing) and catboost (.cbm loading) are imported where they are used,
+# so loading the compiled metadata artifact needs neither
+from .tree_engine import ObliviousTreeEnsemble
+from .metadata_store import METADATA_FILES, ARTIFACT_NAME, load_artifact
 
 # Path to the base directory of models and metadata (relative to where main.py runs)
 MODELS_DIR = 'Trained_models'
 METADATA_DIR = 'metadata'
 
-def load_model(model_name: str):
+# When a '.pkl' model has a '.cbm' sibling with the same name (see convert_to_cbm),
+# load the native file instead: it skips unpickling and loads noticeably faster.
+PREFER_NATIVE_FORMAT = os.environ.get('PREFER_NATIVE_MODEL_FORMAT', '1') == '1'
+
+# Compiled metadata (see App/metadata_store.py). load_all_metadata reads it instead of
+# the CSVs when it exists and is current; otherwise it falls back to parsing the CSVs.
+METADATA_ARTIFACT = os.environ.get('METADATA_ARTIFACT', os.path.join(METADATA_DIR, ARTIFACT_NAME))
+USE_METADATA_ARTIFACT = os.environ.get('USE_METADATA_ARTIFACT', '1') == '1'
+
+# Inference engine: 'catboost' (model.predict), 'numpy' (App/tree_engine.py, evaluated from
+# the non-zero features of each row) or 'auto' (numpy for small batches, where CatBoost's
+# per-call overhead dominates, and catboost for larger ones)
+INFERENCE_ENGINE = os.environ.get('INFERENCE_ENGINE', 'catboost')
+NUMPY_ENGINE_MAX_ROWS = int(os.environ.get('NUMPY_ENGINE_MAX_ROWS', '32')) # Largest batch 'auto' sends to numpy
+ENGINE_CHECK_TOLERANCE = 1e-6 # Max relative difference from model.predict accepted for the numpy engine
+
+# All models served by the app: target name -> (model file, predicts log1p-transformed values)
+MODEL_TARGETS = {
+    "copies_sold": ('catboost_model_Copies Sold.pkl', True), # Keep as is, adjust if needed
+    "wishlists": ('catboost_model_Wishlists.pkl', False),
+    "bayesian_score": ('catboost_model_bayesian_score.pkl', False)
+}
+
+# Models loaded at startup, keyed by prediction target (e.g. 'copies_sold').
+# Each entry holds the model object, its file name, a content-based version string
+# and whether it predicts log1p-transformed values.
+MODEL_REGISTRY = {}
+
+def load_model(model_name: str, target: str = None, log_transformed: bool = False):
     """
     Loads a pre-trained model from the 'Trained_models' directory.
-    Assumes the model is saved with joblib.
+    '.cbm' files are read with CatBoost's native loader, anything else with joblib.
+
+    If 'target' is given, the model is also registered in MODEL_REGISTRY
+    under that name, along with its 'log_transformed' flag.
     """
-    model_path = os.path.join(MODELS_DIR, model_name)
+    model_path = resolve_model_path(model_name)
     try:
-        # If your CatBoost models were saved as .cbm files, you'd use:
-        # model = CatBoostRegressor().load_model(model_path)
-        # But given your .pkl extension, joblib.load is correct.
-        model = joblib.load(model_path)
+        if model_path.endswith('.cbm'):
+            from catboost import CatBoostRegressor
+            model = CatBoostRegressor().load_model(model_path, format='cbm')
+        else:
+            model = joblib.load(model_path)
         print(f"Model '{model_name}' loaded successfully from {model_path}.")
+        if target is not None:
+            register_model(target, model, model_name, log_transformed, model_version(model_path))
         return model
     except FileNotFoundError:
         print(f"Error: Model file not found at {model_path}. Please check path and file name.")
@@ -30,12 +68,120 @@ def load_model(model_name: str):
         print(f"Error loading model '{model_name}': {e}")
         raise
 
+def resolve_model_path(model_name: str) -> str:
+    """
+    Path of the file to load for 'model_name', preferring a converted '.cbm'
+    sibling unless the '.pkl' is newer (a new pickle dropped next to an old conversion).
+    """
+    model_path = os.path.join(MODELS_DIR, model_name)
+    if PREFER_NATIVE_FORMAT and model_path.endswith('.pkl'):
+        native_path = model_path[:-len('.pkl')] + '.cbm'
+        try:
+            if os.stat(native_path).st_mtime_ns >= os.stat(model_path).st_mtime_ns:
+                return native_path
+        except FileNotFoundError:
+            if not os.path.exists(model_path) and os.path.exists(native_path):
+                return native_path # Only the converted file was deployed
+    return model_path
+
+def convert_to_cbm(model_name: str) -> str:
+    """
+    Saves a pickled CatBoost model in the native '.cbm' format next to the
+    original, after checking that both files predict the same values.
+
+    Returns:
+        str: Path of the written '.cbm' file.
+    """
+    pickle_path = os.path.join(MODELS_DIR, model_name)
+    native_path = os.path.splitext(pickle_path)[0] + '.cbm'
+    model = joblib.load(pickle_path)
+    model.save_model(native_path, format='cbm')
+
+    check_matrix = np.random.default_rng(0).random((32, len(model.feature_names_)))
+    from catboost import CatBoostRegressor
+    native_model = CatBoostRegressor().load_model(native_path, format='cbm')
+    if not np.allclose(model.predict(check_matrix), native_model.predict(check_matrix)):
+        os.remove(native_path)
+        raise ValueError(f"Converted model '{native_path}' does not reproduce '{pickle_path}'.")
+    print(f"Converted '{pickle_path}' to '{native_path}'.")
+    return native_path
+
+def model_version(model_path: str) -> str:
+    """Short content hash of a model file, used to tell artifacts apart."""
+    with open(model_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def build_tree_evaluator(model):
+    """
+    Exports 'model' for the numpy engine and checks it against model.predict on
+    random sparse rows.
+
+    Returns:
+        ObliviousTreeEnsemble: The evaluator, or None (after printing why) if the
+                               model cannot be exported or does not match.
+    """
+    try:
+        evaluator = ObliviousTreeEnsemble.from_catboost(model)
+        rng = np.random.default_rng(0)
+        check_matrix = (rng.random((64, evaluator.n_features)) < 0.03).astype(np.float64)
+        check_matrix[:, :5] = rng.random((64, 5)) * 10.0 ** rng.integers(0, 6, (64, 5))
+        expected = np.asarray(model.predict(check_matrix), dtype=float)
+        if not np.allclose(evaluator.predict(check_matrix), expected, rtol=ENGINE_CHECK_TOLERANCE, atol=0):
+            raise ValueError("predictions differ from model.predict")
+    except Exception as e:
+        print(f"NumPy inference engine unavailable for this model, using CatBoost: {e}")
+        return None
+    return evaluator
+
+def register_model(target: str, model, model_name: str, log_transformed: bool = False, version: str = None):
+    """Adds (or replaces) the model serving 'target' in MODEL_REGISTRY."""
+    MODEL_REGISTRY[target] = {
+        "model": model,
+        "model_name": model_name,
+        "version": version or model_name,
+        "log_transformed": log_transformed,
+        # Flat-array copy of the trees for the numpy engine (None when CatBoost serves every call)
+        "evaluator": build_tree_evaluator(model) if INFERENCE_ENGINE in ('numpy', 'auto') else None
+    }
+
+def get_model_entry(target: str):
+    """Returns the MODEL_REGISTRY entry for 'target', or None if no such model is loaded."""
+    return MODEL_REGISTRY.get(target)
+
+def load_all_models(targets=None):
+    """Loads and registers the models for 'targets' (default: every entry of MODEL_TARGETS)."""
+    for target in targets or MODEL_TARGETS:
+        model_file, log_transformed = MODEL_TARGETS[target]
+        load_model(model_file, target=target, log_transformed=log_transformed)
+    return MODEL_REGISTRY
+
+def predict_raw_with_entry(entry: dict, matrix) -> np.ndarray:
+    """Raw model output (before any inverse log transform) for an encoded feature matrix."""
+    evaluator = entry.get("evaluator")
+    if evaluator is not None and (INFERENCE_ENGINE == 'numpy' or len(matrix) <= NUMPY_ENGINE_MAX_ROWS):
+        return evaluator.predict(matrix)
+    return np.asarray(entry["model"].predict(matrix), dtype=float)
+
+def transform_predictions(entry: dict, predictions: np.ndarray) -> np.ndarray:
+    """Undoes the log transform (and clips at zero) where the entry's model uses one."""
+    if entry["log_transformed"]:
+        predictions = np.clip(np.expm1(predictions), 0, None)
+    return predictions
+
+def predict_with_entry(entry: dict, matrix) -> np.ndarray:
+    """
+    Scores an encoded feature matrix with a registry entry's model, undoing
+    the log transform (and clipping at zero) where the model uses one.
+    """
+    return transform_predictions(entry, predict_raw_with_entry(entry, matrix))
+
 def load_list_from_csv(file_name: str):
     """
     Loads a list of strings from a CSV file in the 'metadata' directory.
     Assumes it's a single column CSV.
     """
     file_path = os.path.join(METADATA_DIR, file_name)
+    import pandas as pd # Only the CSV fallback and the artifact build parse CSVs
     try:
         # Using .squeeze().tolist() as shown in your Streamlit app
         data_list = pd.read_csv(file_path, header=None).squeeze().tolist()
@@ -51,21 +197,49 @@ def load_list_from_csv(file_name: str):
 def load_all_metadata():
     """
     Loads all necessary metadata lists for preprocessing.
+
+    Reads the compiled artifact (METADATA_ARTIFACT) when USE_METADATA_ARTIFACT
+    is on and the artifact is valid for the current CSVs; otherwise parses
+    the CSVs. Both return the same lists; the artifact's are tuples and come
+    with the encoder's column maps prebuilt.
     """
+    if USE_METADATA_ARTIFACT and os.path.exists(METADATA_ARTIFACT):
+        start = time.perf_counter()
+        try:
+            metadata = load_artifact(METADATA_ARTIFACT, METADATA_DIR)
+            print(f"All metadata lists loaded from '{METADATA_ARTIFACT}' in {(time.perf_counter() - start) * 1000:.1f} ms.")
+            return metadata
+        except Exception as e:
+            print(f"Warning: Metadata artifact '{METADATA_ARTIFACT}' not used, reading the CSVs instead: {e}")
+
     metadata = {}
     try:
-        metadata['feature_columns'] = load_list_from_csv("feature_columns.csv")
-        metadata['tags'] = load_list_from_csv("tags_list.csv")
-        metadata['genres'] = load_list_from_csv("genres_list.csv")
-        metadata['categories'] = load_list_from_csv("categories_list.csv")
-        metadata['publishers'] = load_list_from_csv("publisher_list.csv")
+        for key, file_name in METADATA_FILES.items():
+            metadata[key] = load_list_from_csv(file_name)
         print("All metadata lists loaded successfully.")
         return metadata
     except Exception as e:
         print(f"Error loading all metadata: {e}")
         raise
 
+def check_feature_layout(model, feature_columns):
+    """
+    Raises ValueError if 'model' was trained on other feature columns (or
+    another column order) than 'feature_columns'.
+    """
+    feature_names = getattr(model, 'feature_names_', None)
+    if feature_names is not None and list(feature_names) != list(feature_columns):
+        raise ValueError(f"Model features ({len(feature_names)}) do not match the metadata's "
+                         f"feature_columns ({len(feature_columns)}) in names or order.")
+
 if __name__ == '__main__':
+    # One-time conversion of the shipped pickles: python -m App.model_loader --convert
+    if '--convert' in sys.argv:
+        for file_name in sorted(os.listdir(MODELS_DIR)):
+            if file_name.endswith('.pkl'):
+                convert_to_cbm(file_name)
+        sys.exit(0)
+
     # Example usage:
     try:
         # Remember to account for the space in the model file name
@@ -0,0 +1,266 @@
+# App/model_reload.py
+import json
+import os
+import threading
+import time
+import numpy as np
+from .model_loader import (MODEL_REGISTRY, load_model, register_model, get_model_entry,
+                           resolve_model_path, model_version, check_feature_layout)
+
+WARMUP_ROWS = 64 # Rows in the validation batch scored by a new model before it is swapped in
+
+
+class ReloadInProgress(RuntimeError):
+    """Raised by request_reload when a reload of the same target is already running in this process."""
+
+
+class ModelReloader:
+    """
+    Swaps newly deployed model artifacts into MODEL_REGISTRY without downtime.
+
+    A reload loads the artifact in a background thread, checks it against a
+    warm-up batch and only then replaces the registry entry, in a single dict
+    assignment. Requests that already hold the old entry finish on the old
+    model; no request ever waits for a load. Reloads are triggered explicitly
+    (reload_async) or by a thread polling the model files for changes.
+
+    With a 'control_file', explicit reloads reach every worker process, not
+    just the one that handled the admin request: request_reload swaps the
+    model in the calling worker first and, only if it passed validation there,
+    records (model file, generation) per target in that JSON file. Each
+    process polls it every 'sync_interval' seconds and reloads every target
+    whose generation it has not applied yet. The file thus holds the last
+    good file per target across restarts; a new process applies it when it
+    starts.
+    """
+
+    def __init__(self, feature_columns: list, watch_interval: float = 0.0,
+                 control_file: str = None, sync_interval: float = 2.0):
+        self.feature_columns = list(feature_columns) # Layout the encoder produces
+        self.n_features = len(self.feature_columns)
+        self.watch_interval = watch_interval # Seconds between polls of the model files; 0 disables watching
+        self.control_file = control_file # Shared reload requests; None keeps reloads local to this process
+        self.sync_interval = sync_interval
+        self._generations = {} # target -> generation of the last reload request applied here
+        self._lock = threading.Lock()
+        self._reloading = set()
+        self._status = {} # target -> {"loaded_at", "reloads", "last_error"}
+        self._file_signatures = {}
+        self._watcher = None
+        for target, entry in MODEL_REGISTRY.items():
+            self._status[target] = {"loaded_at": time.time(), "reloads": 0, "last_error": None}
+            self._file_signatures[target] = self._file_signature(entry["model_name"])
+        if self.control_file is not None:
+            self.apply_reload_requests(blocking=True) # Before workers fork, so they start on the chosen files
+
+    @staticmethod
+    def _file_signature(model_name: str):
+        path = resolve_model_path(model_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def warmup_matrix(self) -> np.ndarray:
+        """All-zeros row plus random rows of one-hot flags and numerical values."""
+        rng = np.random.default_rng(0)
+        matrix = (rng.random((WARMUP_ROWS, self.n_features)) < 0.02).astype(np.float64)
+        matrix[:, :5] = rng.random((WARMUP_ROWS, 5)) * 100
+        matrix[0] = 0.0
+        return matrix
+
+    def validate(self, model):
+        """
+        Raises ValueError if 'model' was trained on other feature columns (names
+        or order) than the encoder produces, or does not produce one finite
+        value per warm-up row.
+        """
+        # Same names in the same order: a permuted layout of the right width would score garbage
+        check_feature_layout(model, self.feature_columns)
+        predictions = np.asarray(model.predict(self.warmup_matrix()), dtype=float)
+        if predictions.shape != (WARMUP_ROWS,):
+            raise ValueError(f"Warm-up batch returned shape {predictions.shape}, expected ({WARMUP_ROWS},).")
+        if not np.all(np.isfinite(predictions)):
+            raise ValueError("Warm-up batch produced non-finite predictions.")
+
+    def reload(self, target: str, model_name: str = None) -> dict:
+        """
+        Loads, validates and swaps in the model for 'target' in the calling thread.
+        'model_name' defaults to the file currently registered for the target.
+
+        Returns:
+            dict: The new registry entry.
+        """
+        current = get_model_entry(target)
+        if current is None:
+            raise KeyError(target)
+        model_name = model_name or current["model_name"]
+        signature = self._file_signature(model_name)
+        try:
+            version = model_version(resolve_model_path(model_name))
+            model = load_model(model_name)
+            self.validate(model)
+        except Exception as e:
+            self._status[target]["last_error"] = f"{model_name}: {e}"
+            print(f"Reload of '{target}' from '{model_name}' rejected: {e}")
+            raise
+        register_model(target, model, model_name, current["log_transformed"], version)
+        self._file_signatures[target] = signature
+        self._status[target] = {
+            "loaded_at": time.time(),
+            "reloads": self._status[target]["reloads"] + 1,
+            "last_error": None
+        }
+        print(f"Model for '{target}' swapped to '{model_name}' (version {version}, was {current['version']}).")
+        return get_model_entry(target)
+
+    def reload_async(self, target: str, model_name: str = None) -> bool:
+        """
+        Starts a background reload of 'target'.
+
+        Returns:
+            bool: False if a reload of that target is already running.
+        """
+        with self._lock:
+            if target in self._reloading:
+                return False
+            self._reloading.add(target)
+
+        def run():
+            try:
+                self.reload(target, model_name)
+            except Exception:
+                pass # Already recorded in the target's status
+            finally:
+                with self._lock:
+                    self._reloading.discard(target)
+
+        threading.Thread(target=run, name=f"model-reload-{target}", daemon=True).start()
+        return True
+
+    # --- Reload requests shared between worker processes ---
+
+    def _read_requests(self) -> dict:
+        try:
+            with open(self.control_file) as f:
+                requests = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read model reload requests from '{self.control_file}': {e}")
+            return {}
+        return requests if isinstance(requests, dict) else {}
+
+    def request_reload(self, target: str, model_name: str = None):
+        """
+        Reloads 'target' (to 'model_name', default its current file) in the
+        calling thread and, once the new model is serving here, records the
+        reload for every other process.
+
+        Returns:
+            tuple: (new registry entry, generation of the recorded request, or
+                   None without a control file). GET /admin/models shows the
+                   generation each worker has applied.
+
+        Raises:
+            ReloadInProgress: If a reload of 'target' is already running here.
+            Exception: Whatever made loading or validating the model fail;
+                       nothing is recorded then.
+        """
+        with self._lock:
+            if target in self._reloading:
+                raise ReloadInProgress(target)
+            self._reloading.add(target)
+        try:
+            entry = self.reload(target, model_name)
+        finally:
+            with self._lock:
+                self._reloading.discard(target)
+        if self.control_file is None:
+            return entry, None
+
+        import fcntl
+        with open(f"{self.control_file}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX) # Serializes read-modify-write between workers
+            requests = self._read_requests()
+            generation = int(requests.get(target, {}).get("generation", 0)) + 1
+            requests[target] = {"model_name": entry["model_name"], "generation": generation}
+            tmp_path = f"{self.control_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(requests, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.control_file)
+            self._generations[target] = generation # Already serving it
+        return entry, generation
+
+    def apply_reload_requests(self, blocking: bool = False):
+        """Reloads every target with a request in the control file newer than the last one applied here."""
+        for target, wanted in self._read_requests().items():
+            if target not in MODEL_REGISTRY or not isinstance(wanted, dict):
+                continue
+            generation = wanted.get("generation", 0)
+            if generation <= self._generations.get(target, 0):
+                continue
+            model_name = wanted.get("model_name")
+            if blocking:
+                self._generations[target] = generation
+                if model_name != get_model_entry(target)["model_name"]:
+                    try:
+                        self.reload(target, model_name)
+                    except Exception:
+                        pass # Recorded in the target's status; keeps serving the current model
+            elif self.reload_async(target, model_name):
+                # A failed reload is not retried until a newer request arrives
+                self._generations[target] = generation
+
+    def is_reloading(self, target: str) -> bool:
+        return target in self._reloading
+
+    def check_for_changes(self):
+        """Starts a reload for every registered model whose file has changed on disk."""
+        for target, entry in list(MODEL_REGISTRY.items()):
+            signature = self._file_signature(entry["model_name"])
+            if signature is not None and signature != self._file_signatures.get(target):
+                print(f"Model file for '{target}' changed on disk; reloading.")
+                self._file_signatures[target] = signature
+                self.reload_async(target)
+
+    def start_watching(self):
+        """Starts the polling thread (also in every process forked from this one)."""
+        if self.watch_interval <= 0 and self.control_file is None:
+            return
+        self._start_watcher()
+        os.register_at_fork(after_in_child=self._start_watcher)
+
+    def _start_watcher(self):
+        intervals = [i for i in (self.watch_interval, self.sync_interval if self.control_file else 0) if i > 0]
+
+        def watch():
+            next_file_check = time.monotonic() + self.watch_interval
+            while True:
+                time.sleep(min(intervals))
+                if self.control_file is not None:
+                    self.apply_reload_requests()
+                if self.watch_interval > 0 and time.monotonic() >= next_file_check:
+                    self.check_for_changes()
+                    next_file_check = time.monotonic() + self.watch_interval
+
+        self._reloading = set()
+        self._lock = threading.Lock()
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def status(self) -> dict:
+        return {
+            target: {
+                "model_name": entry["model_name"],
+                "version": entry["version"],
+                "log_transformed": entry["log_transformed"],
+                "engine": "numpy" if entry.get("evaluator") is not None else "catboost",
+                "reloading": target in self._reloading,
+                "reload_generation": self._generations.get(target, 0),
+                "worker_pid": os.getpid(),
+                **self._status.get(target, {})
+            }
+            for target, entry in MODEL_REGISTRY.items()
+        }
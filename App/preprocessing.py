@@ -1,8 +1,249 @@
 # App/preprocessing.py
 import numpy as np
-import pandas as pd
 
-def preprocess_input(raw_input: dict, metadata: dict):
+# Maps the API's numerical input keys to their model feature column names.
+NUMERICAL_FEATURES = {
+    "time_to_beat": "time_to_beat",
+    "price": "Price",
+    "followers": "Followers",
+    "engagement_ratio": "engagement_ratio"
+}
+
+# Column prefixes used for the one-hot encoded categorical features.
+PUBLISHER_PREFIX = "Publishers Class_"
+TAG_PREFIX = "Tags_"
+GENRE_PREFIX = "genres_"
+CATEGORY_PREFIX = "categories_"
+
+
+def build_indexes(metadata: dict) -> dict:
+    """
+    The column maps FeatureEncoder works from: 'columns' (feature column name ->
+    index) and, for 'publishers', 'tags', 'genres' and 'categories', known
+    value -> column index (None if the value has no matching feature column).
+    The metadata artifact (App/metadata_store.py) stores them prebuilt.
+    """
+    column_index = {col: i for i, col in enumerate(metadata['feature_columns'])}
+    indexes = {'columns': column_index}
+    for key, prefix in (('publishers', PUBLISHER_PREFIX), ('tags', TAG_PREFIX),
+                        ('genres', GENRE_PREFIX), ('categories', CATEGORY_PREFIX)):
+        indexes[key] = {value: column_index.get(f"{prefix}{value}") for value in (metadata.get(key) or [])}
+    return indexes
+
+
+def _is_known(value, index: dict) -> bool:
+    """Membership test that, like the list lookup it replaces, treats unhashable values as unknown."""
+    try:
+        return value in index
+    except TypeError:
+        return False
+
+
+class FeatureEncoder:
+    """
+    Encodes raw API input into the model's feature vector.
+
+    Built once from the loaded metadata: every column lookup the old
+    DataFrame path did per request (membership checks against the metadata
+    lists, column existence checks) is resolved up front into dicts mapping
+    a value to its column index. Encoding a request then only touches the
+    features that are actually selected and writes them straight into a
+    float64 NumPy row, in the order given by 'feature_columns'.
+
+    If given, 'on_unknown' is called with a kind ('tag', 'genre', 'category',
+    'publisher', or e.g. 'tag_without_column' for values that are in the
+    metadata lists but have no feature column) for every value it skips.
+    """
+
+    def __init__(self, metadata: dict, on_unknown=None):
+        feature_columns = metadata.get('feature_columns')
+        if not feature_columns:
+            raise ValueError("Feature columns metadata is missing. Cannot preprocess input.")
+
+        self.feature_columns = list(feature_columns)
+        self.n_features = len(self.feature_columns)
+        self.on_unknown = on_unknown
+        # Prebuilt when the metadata comes from the compiled artifact
+        indexes = metadata.get('indexes') or build_indexes(metadata)
+        column_index = indexes['columns']
+
+        # Numerical features: input key -> (column name, column index or None)
+        self.numerical_index = {
+            key: (col, column_index.get(col)) for key, col in NUMERICAL_FEATURES.items()
+        }
+
+        # Categorical features: known value -> column index (None if the value is
+        # known from the metadata lists but has no matching feature column).
+        self.publisher_index = indexes['publishers']
+        self.tag_index = indexes['tags']
+        self.genre_index = indexes['genres']
+        self.category_index = indexes['categories']
+
+    def encode_sparse(self, raw_input: dict) -> list:
+        """
+        Returns the non-default features of 'raw_input' as a list of
+        (column index, value) pairs. Everything not listed is 0.0.
+
+        Raises:
+            ValueError: If a numerical feature cannot be converted to float.
+        """
+        active = []
+
+        for key, (col, idx) in self.numerical_index.items():
+            value = float(raw_input.get(key, 0.0))
+            if idx is not None:
+                active.append((idx, value))
+            else:
+                print(f"Warning: Numerical column '{col}' not found in feature_columns. Skipping.")
+
+        selected_publisher = raw_input.get("selected_publisher")
+        if selected_publisher and _is_known(selected_publisher, self.publisher_index):
+            idx = self.publisher_index[selected_publisher]
+            if idx is not None:
+                active.append((idx, 1.0))
+            else:
+                print(f"Warning: Publisher column '{PUBLISHER_PREFIX}{selected_publisher}' not found in feature_columns.")
+                self._report_unknown("publisher_without_column")
+        elif selected_publisher:
+            self._report_unknown("publisher")
+
+        self._encode_selection(raw_input.get("selected_tags", []), self.tag_index,
+                               TAG_PREFIX, "Tag", "tag", "tags_list.csv", active)
+        self._encode_selection(raw_input.get("selected_genres", []), self.genre_index,
+                               GENRE_PREFIX, "Genre", "genre", "genres_list.csv", active)
+        self._encode_selection(raw_input.get("selected_categories", []), self.category_index,
+                               CATEGORY_PREFIX, "Category", "category", "categories_list.csv", active)
+        return active
+
+    def _report_unknown(self, kind: str):
+        if self.on_unknown is not None:
+            self.on_unknown(kind)
+
+    def _encode_selection(self, selected, index: dict, prefix: str, label: str, noun: str,
+                          source_file: str, active: list):
+        for value in selected:
+            if _is_known(value, index): # Validate value against known metadata values
+                idx = index[value]
+                if idx is not None:
+                    active.append((idx, 1.0))
+                else:
+                    print(f"Warning: {label} column '{prefix}{value}' not found in feature_columns.")
+                    self._report_unknown(f"{noun}_without_column")
+            else:
+                print(f"Warning: Provided {noun} '{value}' is not in known {source_file}.")
+                self._report_unknown(noun)
+
+    def canonical_key(self, raw_input: dict) -> tuple:
+        """
+        Returns a hashable key that is equal for inputs that encode identically
+        up to ordering and duplicates: numerical fields normalized to float,
+        the publisher, and the sorted, de-duplicated tags, genres and categories.
+
+        Raises:
+            ValueError: If a numerical feature cannot be converted to float.
+            TypeError: If a selection contains unhashable or unorderable values,
+                       or the publisher is not a string.
+        """
+        publisher = raw_input.get("selected_publisher") or None
+        if publisher is not None and not isinstance(publisher, str):
+            # A list or dict would make the key unhashable; such inputs are not cached
+            raise TypeError(f"selected_publisher must be a string, got {type(publisher).__name__}.")
+        return (
+            tuple(float(raw_input.get(key, 0.0)) for key in self.numerical_index),
+            publisher,
+            tuple(sorted(set(raw_input.get("selected_tags", [])))),
+            tuple(sorted(set(raw_input.get("selected_genres", [])))),
+            tuple(sorted(set(raw_input.get("selected_categories", []))))
+        )
+
+    def encode(self, raw_input: dict, out: np.ndarray = None) -> np.ndarray:
+        """
+        Encodes 'raw_input' into a float64 row of shape (1, n_features).
+
+        If 'out' is given it must be a zeroed float64 array with n_features
+        elements; it is filled in place and returned.
+        """
+        if out is None:
+            out = np.zeros((1, self.n_features), dtype=np.float64)
+        row = out.reshape(-1)
+        for idx, value in self.encode_sparse(raw_input):
+            row[idx] = value
+        return out
+
+    def encode_batch(self, raw_inputs: list):
+        """
+        Encodes a list of raw inputs into one float64 matrix.
+
+        Records that fail validation do not abort the batch; they are left out
+        of the matrix and reported in 'errors' instead.
+
+        Returns:
+            tuple: (matrix, positions, errors) where 'matrix' has one row per
+                   valid record, 'positions' gives the index in 'raw_inputs' of
+                   each matrix row, and 'errors' maps the index of each rejected
+                   record to its error message.
+        """
+        matrix = np.zeros((len(raw_inputs), self.n_features), dtype=np.float64)
+        positions = []
+        errors = {}
+        for i, raw_input in enumerate(raw_inputs):
+            if not isinstance(raw_input, dict):
+                errors[i] = "Each item must be a JSON object."
+                continue
+            try:
+                active = self.encode_sparse(raw_input)
+            except (ValueError, TypeError) as e:
+                errors[i] = f"Input validation/preprocessing error: {e}"
+                continue
+            row = matrix[len(positions)]
+            for idx, value in active:
+                row[idx] = value
+            positions.append(i)
+        return matrix[:len(positions)], positions, errors
+
+    def numerical_column_index(self, name: str) -> int:
+        """
+        Column index of a numerical feature, given either its input key
+        (e.g. 'price') or its feature column name (e.g. 'Price').
+
+        Raises:
+            ValueError: If 'name' is not a numerical feature of the model.
+        """
+        for key, (col, idx) in self.numerical_index.items():
+            if name in (key, col) and idx is not None:
+                return idx
+        raise ValueError(f"'{name}' is not a numerical feature. Expected one of: "
+                         f"{', '.join(col for col, _ in self.numerical_index.values())}.")
+
+    def encode_grid(self, raw_input: dict, axes: list, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Encodes 'raw_input' once and broadcasts it over a grid of values for
+        one or two numerical features.
+
+        Args:
+            axes (list): (feature name, 1-D array of values) pairs.
+            start, stop (int, optional): Only encode grid points start..stop-1,
+                                         so a large grid can be scored in blocks.
+
+        Returns:
+            np.ndarray: One row per grid point, the last axis varying fastest
+                        (row-major order of the grid).
+        """
+        base = self.encode(raw_input)
+        shape = tuple(len(values) for _, values in axes)
+        points = np.arange(start, int(np.prod(shape)) if stop is None else stop)
+        matrix = np.repeat(base, len(points), axis=0)
+        for (name, values), index in zip(axes, np.unravel_index(points, shape)):
+            matrix[:, self.numerical_column_index(name)] = np.asarray(values, dtype=np.float64)[index]
+        return matrix
+
+    def to_frame(self, matrix: np.ndarray):
+        """Wraps an encoded matrix in a pandas DataFrame with the feature column names."""
+        import pandas as pd # Only this helper needs pandas; the serving path never calls it
+        return pd.DataFrame(np.atleast_2d(matrix), columns=self.feature_columns)
+
+
+def preprocess_input(raw_input: dict, metadata: dict, encoder: FeatureEncoder = None):
     """
     Preprocesses raw input data from an API request into a format
     suitable for the CatBoost model. This mimics the Streamlit app's logic.
@@ -17,6 +258,8 @@ def preprocess_input(raw_input: dict, metadata: dict):
                                  "selected_publisher": "PublisherA"}
         metadata (dict): A dictionary containing 'feature_columns', 'tags', 'genres',
                          'categories', 'publishers' lists loaded from metadata files.
+        encoder (FeatureEncoder, optional): A prebuilt encoder for 'metadata'.
+                         Pass one to avoid rebuilding the column maps per call.
 
     Returns:
         pd.DataFrame: A pandas DataFrame ready for model prediction,
@@ -25,92 +268,9 @@ def preprocess_input(raw_input: dict, metadata: dict):
     Raises:
         ValueError: If essential features are missing or data types are incorrect.
     """
-    feature_columns = metadata.get('feature_columns')
-    all_tags = metadata.get('tags')
-    all_genres = metadata.get('genres')
-    all_categories = metadata.get('categories')
-    all_publishers = metadata.get('publishers')
-
-    if not feature_columns:
-        raise ValueError("Feature columns metadata is missing. Cannot preprocess input.")
-
-    # Initialize a DataFrame with zeros for all expected feature columns
-    # This handles one-hot encoding by default (all zeros, then set 1 for selected)
-    input_df = pd.DataFrame(np.zeros((1, len(feature_columns))), columns=feature_columns)
-
-    # Extract numerical features and set them directly
-    numerical_features = {
-        "time_to_beat": float(raw_input.get("time_to_beat", 0.0)),
-        "Price": float(raw_input.get("price", 0.0)),
-        "Followers": float(raw_input.get("followers", 0.0)),
-        "engagement_ratio": float(raw_input.get("engagement_ratio", 0.0))
-    }
-    for col, value in numerical_features.items():
-        if col in input_df.columns:
-            input_df.at[0, col] = value
-        else:
-            print(f"Warning: Numerical column '{col}' not found in feature_columns. Skipping.")
-
-    # Handle one-hot encoded categorical features
-    # Publishers Class
-    selected_publisher = raw_input.get("selected_publisher")
-    if selected_publisher and selected_publisher in all_publishers:
-        col = f"Publishers Class_{selected_publisher}"
-        if col in input_df.columns:
-            input_df.at[0, col] = 1
-        else:
-            print(f"Warning: Publisher column '{col}' not found in feature_columns.")
-
-    # Tags
-    selected_tags = raw_input.get("selected_tags", [])
-    for tag in selected_tags:
-        if tag in all_tags: # Validate tag against known tags
-            col = f"Tags_{tag}"
-            if col in input_df.columns:
-                input_df.at[0, col] = 1
-            else:
-                print(f"Warning: Tag column '{col}' not found in feature_columns.")
-        else:
-            print(f"Warning: Provided tag '{tag}' is not in known tags_list.csv.")
-
-    # Genres
-    selected_genres = raw_input.get("selected_genres", [])
-    for genre in selected_genres:
-        if genre in all_genres: # Validate genre against known genres
-            col = f"genres_{genre}"
-            if col in input_df.columns:
-                input_df.at[0, col] = 1
-            else:
-                print(f"Warning: Genre column '{col}' not found in feature_columns.")
-        else:
-            print(f"Warning: Provided genre '{genre}' is not in known genres_list.csv.")
-
-    # Categories
-    selected_categories = raw_input.get("selected_categories", [])
-    for category in selected_categories:
-        if category in all_categories: # Validate category against known categories
-            col = f"categories_{category}"
-            if col in input_df.columns:
-                input_df.at[0, col] = 1
-            else:
-                print(f"Warning: Category column '{col}' not found in feature_columns.")
-        else:
-            print(f"Warning: Provided category '{category}' is not in known categories_list.csv.")
-
-    # Final check: Ensure the DataFrame has the exact columns in the correct order
-    # and convert to float as per your Streamlit app.
-    try:
-        input_df = input_df[feature_columns]
-        input_df = input_df.astype(float)
-    except KeyError as e:
-        raise ValueError(f"Feature mismatch: Expected column '{e}' not found after preprocessing. "
-                         "This might indicate an issue with feature_columns.csv or input data.")
-    except Exception as e:
-        raise ValueError(f"Error during final input DataFrame processing: {e}")
-
-    # CatBoost models can often take pandas DataFrames directly.
-    # If not, convert to numpy array: input_df.values
-    return input_df
+    if encoder is None:
+        encoder = FeatureEncoder(metadata)
+    return encoder.to_frame(encoder.encode(raw_input))
 
 if __name__ == '__main__':
     # --- Example Usage for Testing ---
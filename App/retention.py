@@ -0,0 +1,373 @@
+# App/retention.py
+"""
+Retention for the prediction log: roll old raw rows up into aggregates,
+then archive or delete them, so database.db stops growing without bound.
+
+Usage (from the project root):
+    python -m App.retention --days 30                        # roll up and delete rows older than 30 days
+    python -m App.retention --days 30 --archive-dir archive  # move them to archive/predictions-YYYY-MM.db instead
+    python -m App.retention --vacuum                         # one-off: convert an old database to incremental vacuum
+
+Rows are handled one period (hour or day) at a time, oldest first, and only
+periods that ended before the cutoff:
+  1. Roll-up: count, mean, min, max and p50/p90/p99 of the (non-NULL) predictions per
+     model, overall and per publisher and genre, into prediction_rollups.
+     The period is then recorded in retention_periods, so it is never rolled
+     up twice (and never again from a half-deleted period).
+  2. Purge: raw rows (and their prediction_features) are copied to the
+     month's archive file when an archive directory is set, then deleted, in
+     chunks of a few thousand rows, one short write transaction per chunk,
+     so request logging is never blocked for long.
+  3. Incremental vacuum returns a bounded number of freed pages to the OS.
+
+The same pass runs from the CLI (e.g. cron) or from RetentionTask, a
+background thread in the app. A lock file lets only one process at a time
+run it, however many workers have the task enabled.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+from . import database
+
+RETENTION_DAYS = 30           # Raw rows older than this are rolled up and purged
+ROLLUP_GRANULARITY = 'day'    # 'hour' or 'day'
+PURGE_CHUNK_SIZE = 5000       # Raw rows deleted per write transaction
+PURGE_CHUNK_PAUSE = 0.05      # Seconds between chunks, so other writers get the lock
+VACUUM_PAGES = 5000           # Pages released per incremental vacuum
+QUANTILES = (0.5, 0.9, 0.99)
+
+# granularity -> (length of the timestamp prefix naming the period, period length)
+GRANULARITIES = {
+    'hour': (13, timedelta(hours=1)),
+    'day': (10, timedelta(days=1))
+}
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+ARCHIVE_COLUMNS = "id, timestamp, input_data, prediction, model, model_version, publisher"
+ARCHIVE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        timestamp DATETIME,
+        input_data TEXT,
+        prediction REAL,
+        model TEXT,
+        model_version TEXT,
+        publisher TEXT
+    )
+'''
+
+
+def period_bounds(timestamp: str, granularity: str) -> tuple:
+    """(period name, start timestamp, end timestamp) of the period containing 'timestamp'."""
+    length, step = GRANULARITIES[granularity]
+    period = timestamp[:length]
+    start = datetime.strptime(period, '%Y-%m-%d %H' if granularity == 'hour' else '%Y-%m-%d')
+    return period, start.strftime(TIMESTAMP_FORMAT), (start + step).strftime(TIMESTAMP_FORMAT)
+
+def retention_cutoff(retention_days: float, granularity: str, now: datetime = None) -> str:
+    """Start of the period containing now - retention_days; only periods before it are processed."""
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=retention_days)).strftime(TIMESTAMP_FORMAT)
+    return period_bounds(cutoff, granularity)[1]
+
+
+# --- Roll-up ---
+
+# dimension -> query of (model, dimension value, prediction) for one period, ordered by group
+ROLLUP_QUERIES = {
+    'all': "SELECT COALESCE(model, ''), '', prediction FROM predictions "
+           "WHERE timestamp >= ? AND timestamp < ? ORDER BY 1",
+    'publisher': "SELECT COALESCE(model, ''), COALESCE(publisher, ''), prediction FROM predictions "
+                 "WHERE timestamp >= ? AND timestamp < ? ORDER BY 1, 2",
+    'genre': "SELECT COALESCE(p.model, ''), f.value, p.prediction FROM predictions AS p "
+             "JOIN prediction_features AS f ON f.prediction_id = p.id AND f.kind = 'genre' "
+             "WHERE p.timestamp >= ? AND p.timestamp < ? ORDER BY 1, 2"
+}
+
+
+def _summary(model: str, dimension: str, value: str, predictions: array) -> tuple:
+    """Roll-up row of one group, over its non-NULL predictions; 'count' is how many there were."""
+    values = np.frombuffer(predictions, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return (model, dimension, value, 0) + (None,) * (3 + len(QUANTILES))
+    with np.errstate(invalid='ignore'): # Infinite predictions give NaN (stored as NULL) quantiles
+        quantiles = np.quantile(values, QUANTILES)
+    return (model, dimension, value, len(values), float(values.mean()), float(values.min()),
+            float(values.max()), *(float(q) for q in quantiles))
+
+def _dimension_summaries(conn, dimension: str, start: str, end: str) -> tuple:
+    """
+    Streams one dimension's rows in group order, keeping only the current
+    group's non-NULL predictions (as packed doubles) in memory.
+
+    Returns:
+        tuple: (roll-up rows, raw rows read).
+    """
+    rows = []
+    raw_rows = 0
+    key = None
+    predictions = array('d')
+    for model, value, prediction in conn.execute(ROLLUP_QUERIES[dimension], (start, end)):
+        if (model, value) != key:
+            if key is not None:
+                rows.append(_summary(key[0], dimension, key[1], predictions))
+            key = (model, value)
+            predictions = array('d')
+        if prediction is not None:
+            predictions.append(prediction)
+        raw_rows += 1
+    if key is not None:
+        rows.append(_summary(key[0], dimension, key[1], predictions))
+    return rows, raw_rows
+
+def rollup_period(conn, granularity: str, period: str, start: str, end: str) -> int:
+    """
+    Aggregates the raw rows of one period into prediction_rollups, unless the
+    period was rolled up before.
+
+    Returns:
+        int: Raw rows rolled up (0 if the period was already done).
+    """
+    done = conn.execute("SELECT 1 FROM retention_periods WHERE granularity = ? AND period = ?",
+                        (granularity, period)).fetchone()
+    if done:
+        return 0
+    # Reads need no write lock under WAL; only the short insert below takes it
+    summaries, raw_rows = _dimension_summaries(conn, 'all', start, end)
+    for dimension in ('publisher', 'genre'):
+        summaries.extend(_dimension_summaries(conn, dimension, start, end)[0])
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM retention_periods WHERE granularity = ? AND period = ?",
+                        (granularity, period)).fetchone():
+            conn.execute("ROLLBACK") # Another process got here first
+            return 0
+        conn.executemany(
+            "INSERT OR REPLACE INTO prediction_rollups "
+            "(granularity, period, model, dimension, value, count, mean, min, max, p50, p90, p99) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(granularity, period, *row) for row in summaries]
+        )
+        conn.execute(
+            "INSERT INTO retention_periods (granularity, period, raw_rows, rolled_up_at) VALUES (?, ?, ?, ?)",
+            (granularity, period, raw_rows, database._utc_timestamp())
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return raw_rows
+
+
+# --- Purge ---
+
+def _attach_archive(conn, archive_dir: str, period: str):
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"predictions-{period[:7]}.db") # One file per month
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    # Same columns and nullability as the live table; the trigger and side tables are not archived
+    conn.execute(ARCHIVE_TABLE_SQL.format(name="archive.predictions"))
+    not_null = [row[1] for row in conn.execute("PRAGMA archive.table_info(predictions)") if row[3]]
+    if not_null:
+        # Archives written by earlier versions declared input_data/prediction NOT NULL,
+        # which cannot hold every live row; rebuild them with the live table's constraints
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(ARCHIVE_TABLE_SQL.format(name="archive.predictions_rebuilt"))
+            conn.execute(f"INSERT INTO archive.predictions_rebuilt ({ARCHIVE_COLUMNS}) "
+                         f"SELECT {ARCHIVE_COLUMNS} FROM archive.predictions")
+            conn.execute("DROP TABLE archive.predictions")
+            conn.execute("ALTER TABLE archive.predictions_rebuilt RENAME TO predictions")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def purge_period(conn, start: str, end: str, archive_dir: str = None,
+                 chunk_size: int = PURGE_CHUNK_SIZE, pause: float = PURGE_CHUNK_PAUSE) -> int:
+    """
+    Deletes the raw rows of one period in chunks, first copying them to the
+    month's archive file if 'archive_dir' is set. Safe to rerun after an
+    interruption: rows already in the archive (a chunk's archive write can
+    commit without its deletes, since WAL does not make multi-file commits
+    atomic) are not copied again.
+
+    Raises:
+        RuntimeError: If a chunk's rows are not all in the archive after the
+                      copy; the chunk is rolled back, nothing is deleted.
+
+    Returns:
+        int: Rows deleted.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS purge_chunk (id INTEGER PRIMARY KEY)")
+    if archive_dir:
+        _attach_archive(conn, archive_dir, start)
+    deleted = 0
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM temp.purge_chunk")
+                conn.execute("INSERT INTO temp.purge_chunk SELECT id FROM predictions "
+                             "WHERE timestamp >= ? AND timestamp < ? LIMIT ?", (start, end, chunk_size))
+                count = conn.execute("SELECT COUNT(*) FROM temp.purge_chunk").fetchone()[0]
+                if archive_dir and count:
+                    # Plain INSERT: a row that cannot be archived aborts the chunk instead of being skipped
+                    conn.execute(f"INSERT INTO archive.predictions ({ARCHIVE_COLUMNS}) "
+                                 f"SELECT {ARCHIVE_COLUMNS} FROM predictions WHERE id IN (SELECT id FROM temp.purge_chunk) "
+                                 f"AND id NOT IN (SELECT id FROM archive.predictions WHERE id IN "
+                                 f"(SELECT id FROM temp.purge_chunk))")
+                    archived = conn.execute("SELECT COUNT(*) FROM archive.predictions "
+                                            "WHERE id IN (SELECT id FROM temp.purge_chunk)").fetchone()[0]
+                    if archived != count:
+                        raise RuntimeError(f"Only {archived} of {count} rows were archived; nothing deleted.")
+                conn.execute("DELETE FROM prediction_features WHERE prediction_id IN (SELECT id FROM temp.purge_chunk)")
+                conn.execute("DELETE FROM predictions WHERE id IN (SELECT id FROM temp.purge_chunk)")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            deleted += count
+            if count < chunk_size:
+                return deleted
+            time.sleep(pause)
+    finally:
+        if archive_dir:
+            conn.execute("DETACH DATABASE archive")
+
+def incremental_vacuum(conn, pages: int = VACUUM_PAGES) -> int:
+    """
+    Releases up to 'pages' free pages and truncates the WAL.
+
+    Returns:
+        int: Free pages left in the file.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2: # INCREMENTAL
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+# --- Retention pass ---
+
+def _acquire_lock(database_path: str):
+    """Opens and locks '<database>.retention.lock'; None if another process holds it."""
+    import fcntl
+    lock_file = open(database_path + '.retention.lock', 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def run_retention(retention_days: float = RETENTION_DAYS, granularity: str = ROLLUP_GRANULARITY,
+                  archive_dir: str = None, database_path: str = None, chunk_size: int = PURGE_CHUNK_SIZE,
+                  pause: float = PURGE_CHUNK_PAUSE, vacuum_pages: int = VACUUM_PAGES) -> dict:
+    """
+    One retention pass over every complete period older than 'retention_days'.
+
+    Returns:
+        dict: Periods processed, rows rolled up, rows purged and free pages left,
+              or {"skipped": ...} if another process is running a pass.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'. Available: {', '.join(GRANULARITIES)}.")
+    database_path = database_path or database.DATABASE
+    lock = _acquire_lock(database_path)
+    if lock is None:
+        return {"skipped": "another process is running retention"}
+
+    conn = database.configure_connection(sqlite3.connect(database_path))
+    conn.isolation_level = None # Explicit transactions
+    summary = {"periods": 0, "rolled_up": 0, "purged": 0}
+    try:
+        cutoff = retention_cutoff(retention_days, granularity)
+        while True:
+            oldest = conn.execute("SELECT MIN(timestamp) FROM predictions WHERE timestamp < ?", (cutoff,)).fetchone()[0]
+            if oldest is None:
+                break
+            period, start, end = period_bounds(oldest, granularity)
+            summary["rolled_up"] += rollup_period(conn, granularity, period, start, end)
+            purged = purge_period(conn, start, end, archive_dir, chunk_size, pause)
+            if not purged:
+                raise RuntimeError(f"No rows purged for period '{period}' ({start} - {end}); "
+                                   f"check the timestamp format of row with timestamp '{oldest}'.")
+            summary["purged"] += purged
+            conn.execute("UPDATE retention_periods SET purged_at = ? WHERE granularity = ? AND period = ?",
+                         (database._utc_timestamp(), granularity, period))
+            summary["periods"] += 1
+        summary["free_pages"] = incremental_vacuum(conn, vacuum_pages)
+    finally:
+        conn.close()
+        lock.close()
+    if summary["periods"]:
+        print(f"Retention: rolled up {summary['rolled_up']} and purged {summary['purged']} prediction log rows "
+              f"from {summary['periods']} {granularity} periods before {cutoff}.")
+    return summary
+
+
+class RetentionTask:
+    """Runs run_retention every 'interval' seconds in a background thread."""
+
+    def __init__(self, interval: float, **settings):
+        self.interval = interval
+        self.settings = settings # Keyword arguments of run_retention
+        self.last_run = None
+        self.last_error = None
+        self._thread = None
+
+    def start(self):
+        """Starts the thread (also in every process forked from this one)."""
+        if self.interval <= 0:
+            return
+        self._start_thread()
+        os.register_at_fork(after_in_child=self._start_thread)
+
+    def _start_thread(self):
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.last_run = run_retention(**self.settings)
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Error running prediction log retention: {e}")
+
+        self._thread = threading.Thread(target=loop, name="log-retention", daemon=True)
+        self._thread.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=RETENTION_DAYS, help="Keep raw rows for this many days")
+    parser.add_argument('--granularity', choices=list(GRANULARITIES), default=ROLLUP_GRANULARITY,
+                        help="Roll-up period")
+    parser.add_argument('--archive-dir', help="Move purged rows to per-month database files here instead of dropping them")
+    parser.add_argument('--database', default=database.DATABASE, help="Path of the prediction log database")
+    parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE, help="Rows deleted per transaction")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="Switch the database to incremental auto-vacuum with a full VACUUM (locks it while running)")
+    args = parser.parse_args(argv)
+
+    database.DATABASE = args.database
+    database.init_db() # Creates the roll-up tables
+    print(run_retention(args.days, args.granularity, args.archive_dir, args.database, args.chunk_size))
+    if args.vacuum:
+        conn = sqlite3.connect(args.database)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.close()
+        print("Database vacuumed; incremental vacuum is enabled.")
+
+
+if __name__ == '__main__':
+    main()
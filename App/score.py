@@ -0,0 +1,285 @@
+# App/score.py
+"""
+Streaming bulk scoring of game records, without the Flask app.
+
+Usage (from the project root):
+    python -m App.score games.ndjson -o scores.ndjson
+    python -m App.score games.csv -o scores.csv --targets copies_sold,wishlists --workers 4
+    cat games.ndjson | python -m App.score - > scores.ndjson
+
+Records are read lazily, encoded and scored in fixed-size chunks (one model
+call per chunk and target) and written out as soon as each chunk is done,
+so memory use does not depend on the input size. Input is NDJSON (one JSON
+object per line, the same format as the API's request body) or CSV with the
+same field names; in CSV the list fields hold values separated by '|' (or a
+JSON array). Output is NDJSON, CSV or Parquet (needs pyarrow). Nothing is
+written to the prediction log unless --log is given.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from . import model_loader
+from .model_loader import (load_all_metadata, load_all_models, get_model_entry, predict_with_entry,
+                           MODEL_TARGETS)
+from .preprocessing import FeatureEncoder
+
+DEFAULT_CHUNK_SIZE = 5000
+LIST_FIELDS = ("selected_tags", "selected_genres", "selected_categories")
+
+# Per-process scoring state, set up once by init_scoring (also in each pool worker)
+_ENCODER = None
+_TARGETS = None
+
+
+# --- Reading ---
+
+def _open_input(path: str):
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin)
+    return open(path, newline='', encoding='utf-8')
+
+def _input_format(path: str, fmt: str = None) -> str:
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+def _parse_csv_row(row: dict, list_sep: str) -> dict:
+    record = {}
+    for key, value in row.items():
+        if value is None or value == '':
+            continue
+        if key in LIST_FIELDS:
+            value = json.loads(value) if value.startswith('[') else [v for v in value.split(list_sep) if v]
+        record[key] = value
+    return record
+
+def read_records(path: str, fmt: str = None, list_sep: str = '|'):
+    """
+    Yields (index, record, error) for every input record, reading lazily.
+    'error' is a message (and 'record' None) for lines that cannot be parsed.
+    """
+    with _open_input(path) as f:
+        if _input_format(path, fmt) == 'csv':
+            for index, row in enumerate(csv.DictReader(f)):
+                try:
+                    yield index, _parse_csv_row(row, list_sep), None
+                except ValueError as e:
+                    yield index, None, f"Unparseable CSV row: {e}"
+        else:
+            index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield index, json.loads(line), None
+                except ValueError as e:
+                    yield index, None, f"Unparseable JSON line: {e}"
+                index += 1
+
+def chunked(iterable, size: int):
+    """Yields lists of up to 'size' consecutive items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# --- Scoring ---
+
+def init_scoring(targets: list, engine: str = None):
+    """Loads metadata and the models for 'targets' into this process, optionally choosing the inference engine."""
+    global _ENCODER, _TARGETS
+    if engine:
+        model_loader.INFERENCE_ENGINE = engine
+    # Loader and encoder messages go to stderr so they never mix with output on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        _ENCODER = FeatureEncoder(load_all_metadata())
+        load_all_models(targets)
+    _TARGETS = list(targets)
+
+def score_chunk(chunk: list, id_field: str = None, keep_input: bool = False) -> list:
+    """
+    Encodes one chunk of (index, record, error) items into a single matrix and
+    scores it with one call per target.
+
+    Returns:
+        list: Result dicts in input order; failed records carry an 'error'.
+              With 'keep_input', scored results also carry 'input_data' and
+              'model_versions' (for the prediction log).
+    """
+    records = [record if error is None else None for _, record, error in chunk]
+    matrix, positions, errors = _ENCODER.encode_batch(records)
+
+    versions = {}
+    predictions = {}
+    for target in _TARGETS:
+        entry = get_model_entry(target)
+        versions[target] = entry["version"]
+        predictions[target] = predict_with_entry(entry, matrix).tolist() if positions else []
+
+    results = []
+    row_of = {position: row for row, position in enumerate(positions)}
+    for position, (index, record, error) in enumerate(chunk):
+        result = {"index": index}
+        if id_field and isinstance(record, dict) and id_field in record:
+            result[id_field] = record[id_field]
+        row = row_of.get(position)
+        if row is None:
+            result["error"] = error or errors.get(position)
+        else:
+            for target in _TARGETS:
+                result[target] = predictions[target][row]
+            if keep_input:
+                result["model_versions"] = versions
+                result["input_data"] = record
+        results.append(result)
+    return results
+
+def score_stream(chunks, workers: int = 1, id_field: str = None, keep_input: bool = False):
+    """
+    Yields each chunk's results in input order, scoring chunks in a process
+    pool when 'workers' > 1. At most two chunks per worker are in flight, so
+    a slow writer never lets results pile up in memory.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(chunk, id_field, keep_input)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_scoring,
+                             initargs=(_TARGETS, model_loader.INFERENCE_ENGINE)) as pool:
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append(pool.submit(score_chunk, chunk, id_field, keep_input))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.pop(0).result()
+        for future in in_flight:
+            yield future.result()
+
+
+# --- Writing ---
+
+class _NdjsonWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, results: list):
+        self.stream.write(''.join(json.dumps(r) + '\n' for r in results))
+
+    def close(self):
+        self.stream.flush()
+
+class _CsvWriter:
+    def __init__(self, stream, columns: list):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, fieldnames=columns, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, results: list):
+        self.writer.writerows(results)
+
+    def close(self):
+        self.stream.flush()
+
+class _ParquetWriter:
+    def __init__(self, path: str, columns: list, targets: list):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.columns = columns
+        fields = [pa.field(c, pa.float64() if c in targets else (pa.int64() if c == "index" else pa.string()))
+                  for c in columns]
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, results: list):
+        data = {c: [r.get(c) for r in results] for c in self.columns}
+        for c, field in zip(self.columns, self.schema):
+            if field.type == self.pa.string():
+                data[c] = [None if v is None else str(v) for v in data[c]]
+        self.writer.write_table(self.pa.table(data, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def open_writer(path: str, fmt: str, stdout, targets: list, id_field: str = None):
+    if not fmt:
+        lowered = path.lower()
+        fmt = 'csv' if lowered.endswith('.csv') else 'parquet' if lowered.endswith('.parquet') else 'ndjson'
+    columns = ["index"] + ([id_field] if id_field else []) + list(targets) + ["error"]
+    if fmt == 'parquet':
+        if path == '-':
+            raise SystemExit("Parquet output needs a file path (-o scores.parquet).")
+        return _ParquetWriter(path, columns, targets)
+    stream = stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+    return _CsvWriter(stream, columns) if fmt == 'csv' else _NdjsonWriter(stream)
+
+
+# --- Entry point ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="Input file (.ndjson/.jsonl or .csv), or '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Output file (.ndjson, .csv or .parquet), default stdout")
+    parser.add_argument('--input-format', choices=['ndjson', 'csv'], help="Override the input format")
+    parser.add_argument('--output-format', choices=['ndjson', 'csv', 'parquet'], help="Override the output format")
+    parser.add_argument('--targets', default=','.join(MODEL_TARGETS),
+                        help=f"Comma-separated targets to score (default: {','.join(MODEL_TARGETS)})")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Records per model call")
+    parser.add_argument('--workers', type=int, default=1, help="Score chunks in this many processes")
+    parser.add_argument('--id-field', help="Input field copied to the output to identify each record")
+    parser.add_argument('--list-sep', default='|', help="Separator of list values in CSV input")
+    parser.add_argument('--engine', choices=['catboost', 'numpy', 'auto'],
+                        help="Inference engine (default: INFERENCE_ENGINE or catboost)")
+    parser.add_argument('--log', action='store_true', help="Also write every prediction to the SQLite prediction log")
+    args = parser.parse_args(argv)
+
+    targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+    unknown = [t for t in targets if t not in MODEL_TARGETS]
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(unknown)}. Available targets: {', '.join(MODEL_TARGETS)}.")
+
+    stdout = sys.stdout
+    init_scoring(targets, args.engine) # Also loads the models in this process, for versions and single-process mode
+
+    log_writer = None
+    if args.log:
+        from .database import init_db, PredictionLogWriter
+        with contextlib.redirect_stdout(sys.stderr):
+            init_db()
+            log_writer = PredictionLogWriter(enqueue_timeout=None) # Offline run: wait for the writer, never drop
+            log_writer.start()
+
+    writer = open_writer(args.output, args.output_format, stdout, targets, args.id_field)
+    scored = failed = 0
+    try:
+        chunks = chunked(read_records(args.input, args.input_format, args.list_sep), args.chunk_size)
+        for results in score_stream(chunks, args.workers, args.id_field, keep_input=args.log):
+            if log_writer is not None:
+                log_writer.enqueue([(r["input_data"], r[target], target, r["model_versions"][target])
+                                    for r in results if "error" not in r for target in targets])
+            for r in results:
+                r.pop("input_data", None)
+                r.pop("model_versions", None)
+            writer.write(results)
+            failed += sum(1 for r in results if "error" in r)
+            scored += len(results)
+    finally:
+        writer.close()
+        if log_writer is not None:
+            log_writer.stop()
+    print(f"Scored {scored - failed} records ({failed} failed) for targets: {', '.join(targets)}.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# App/tag_search.py
+"""
+Beam search for the tag combination with the highest predicted value.
+
+The base game is encoded once; each candidate tag set is that row with the
+tags' one-hot columns set, so a whole search step (every beam entry
+extended by every pool tag) becomes one matrix scored in batched model
+calls. Sets reached along different paths (A then B, B then A) are scored
+once. Candidates are ranked on the model's raw output, which the reported
+prediction only transforms monotonically.
+"""
+import heapq
+import time
+import numpy as np
+
+SEARCH_CHUNK_ROWS = 4096 # Rows per model call; the time budget is checked between calls
+
+
+class TagSetSearch:
+    def __init__(self, encoder, score_fn, base: dict, pool: list, fixed_tags: list = ()):
+        """
+        Args:
+            encoder (FeatureEncoder): Encoder of the served feature layout.
+            score_fn (callable): Maps an encoded matrix to raw model outputs.
+            base (dict): The game, in the request format; its own tags are replaced by 'fixed_tags'.
+            pool (list): Candidate tags to add. Each must be in tags_list.csv.
+            fixed_tags (list): Tags every returned set keeps.
+        """
+        self.encoder = encoder
+        self.score_fn = score_fn
+        self.fixed_tags = list(dict.fromkeys(fixed_tags))
+        self.base_row = encoder.encode({**base, "selected_tags": self.fixed_tags})[0]
+
+        self.pool = []
+        self.pool_columns = []
+        for tag in dict.fromkeys(pool):
+            if tag in self.fixed_tags:
+                continue
+            column = encoder.tag_index.get(tag, -1) if isinstance(tag, str) else -1
+            if column == -1:
+                raise ValueError(f"Tag '{tag}' is not in tags_list.csv")
+            if column is None:
+                continue # Known tag the model has no column for; it cannot change a prediction
+            self.pool.append(tag)
+            self.pool_columns.append(column)
+        self.pool_columns = np.array(self.pool_columns, dtype=np.int64)
+
+        self.memo = {} # frozenset of pool positions -> raw score
+        self.scored = 0
+        self.memo_hits = 0
+
+    def _score(self, candidates: list, deadline: float) -> bool:
+        """Scores the not-yet-memoized candidate sets; False if the deadline passed first."""
+        pending = []
+        for candidate in candidates:
+            if candidate in self.memo:
+                self.memo_hits += 1
+            else:
+                self.memo[candidate] = None
+                pending.append(candidate)
+        for start in range(0, len(pending), SEARCH_CHUNK_ROWS):
+            if time.monotonic() > deadline:
+                for candidate in pending[start:]:
+                    del self.memo[candidate]
+                return False
+            chunk = pending[start:start + SEARCH_CHUNK_ROWS]
+            matrix = np.repeat(self.base_row[None, :], len(chunk), axis=0)
+            rows = np.repeat(np.arange(len(chunk)), [len(c) for c in chunk])
+            positions = np.fromiter((p for c in chunk for p in c), dtype=np.int64, count=len(rows))
+            matrix[rows, self.pool_columns[positions]] = 1.0
+            for candidate, score in zip(chunk, self.score_fn(matrix)):
+                self.memo[candidate] = float(score)
+            self.scored += len(chunk)
+        return True
+
+    def run(self, min_tags: int, max_tags: int, beam_width: int, top_k: int, time_budget: float) -> dict:
+        """
+        Grows tag sets one tag per step, keeping the 'beam_width' best sets of
+        each size, until 'max_tags' tags are added or 'time_budget' seconds pass.
+
+        Returns:
+            dict: 'results' (the 'top_k' best sets adding min_tags..max_tags tags,
+                  as (tags, raw score) pairs, best first), 'depth' (largest set size
+                  fully searched), 'complete', 'scored' and 'memo_hits'.
+        """
+        deadline = time.monotonic() + time_budget
+        beam = [frozenset()]
+        depth = 0
+        complete = True
+        for size in range(1, min(max_tags, len(self.pool)) + 1):
+            candidates = [parent | {position} for parent in beam for position in range(len(self.pool))
+                          if position not in parent]
+            if not self._score(candidates, deadline):
+                complete = False
+                break
+            depth = size
+            beam = heapq.nlargest(beam_width, dict.fromkeys(candidates), key=self.memo.__getitem__)
+
+        eligible = [(c, s) for c, s in self.memo.items() if s is not None and min_tags <= len(c) <= max_tags]
+        best = heapq.nlargest(top_k, eligible, key=lambda item: item[1])
+        return {
+            "results": [(self.fixed_tags + sorted(self.pool[p] for p in c), s) for c, s in best],
+            "depth": depth,
+            "complete": complete and depth >= min(max_tags, len(self.pool)),
+            "scored": self.scored,
+            "memo_hits": self.memo_hits
+        }
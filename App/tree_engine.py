@@ -0,0 +1,164 @@
+# App/tree_engine.py
+"""
+NumPy evaluator for CatBoost's oblivious (symmetric) trees.
+
+Every tree of depth D applies the same D splits at each level, so a row's
+leaf is the D-bit number whose bit d is (feature > border) for split d.
+The ensemble is exported once into flat arrays:
+  * the distinct (feature, border) splits, grouped by feature,
+  * each tree's split ids (T x D), and
+  * the leaf values (T x 2^D).
+
+Almost all of the 509 model inputs are one-hot flags and a game sets only a
+few, so predict reads only the non-zero entries of the encoded matrix: the
+split bits of an all-zero row are computed once, and only the splits on a
+row's non-zero features are recomputed. Leaf indices are then assembled with shifts
+and ORs, and the leaf values gathered and summed, for a whole batch at once.
+"""
+import json
+import os
+import tempfile
+import numpy as np
+
+ROW_BLOCK = 512 # Rows evaluated per block, bounding the (trees x depth x rows) temporaries
+
+
+class ObliviousTreeEnsemble:
+    def __init__(self, split_features: np.ndarray, split_borders: np.ndarray, tree_splits: np.ndarray,
+                 leaf_values: np.ndarray, scale: float, bias: float, n_features: int):
+        order = np.lexsort((split_borders, split_features)) # Group splits by feature
+        remap = np.empty_like(order)
+        remap[order] = np.arange(len(order))
+        self.split_features = split_features[order]
+        self.split_borders = split_borders[order].astype(np.float32) # CatBoost compares in float32
+        self.tree_splits = remap[tree_splits]
+        self.depth = tree_splits.shape[1]
+        self.n_trees = tree_splits.shape[0]
+        self.n_features = n_features
+        # Splits on feature f are split_offsets[f]:split_offsets[f + 1]
+        self.split_offsets = np.searchsorted(self.split_features, np.arange(n_features + 1))
+        self.zero_bits = np.float32(0.0) > self.split_borders
+        self.leaf_values = np.ascontiguousarray(leaf_values, dtype=np.float64).reshape(-1)
+        self.leaf_offsets = (np.arange(self.n_trees) << self.depth).astype(np.int64)
+        self.level_weights = (1 << np.arange(self.depth, dtype=np.uint8))[None, :, None]
+        self.scale = float(scale)
+        self.bias = float(bias)
+
+    @classmethod
+    def from_catboost(cls, model):
+        """
+        Exports a fitted CatBoost model's trees via its JSON format.
+        Raises ValueError for models this evaluator cannot reproduce
+        (categorical or text splits, non-symmetric trees, multi-dimensional output).
+        """
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            model.save_model(path, format='json')
+            with open(path) as f:
+                exported = json.load(f)
+        finally:
+            os.remove(path)
+
+        trees = exported.get("oblivious_trees")
+        if not trees:
+            raise ValueError("Model has no oblivious trees.")
+        depths = {len(tree["splits"]) for tree in trees}
+        if len(depths) != 1:
+            raise ValueError(f"Trees of different depths ({sorted(depths)}) are not supported.")
+        depth = depths.pop()
+
+        split_ids = {}
+        tree_splits = np.empty((len(trees), depth), dtype=np.int64)
+        leaf_values = np.empty((len(trees), 1 << depth), dtype=np.float64)
+        for t, tree in enumerate(trees):
+            if len(tree["leaf_values"]) != 1 << depth:
+                raise ValueError("Only single-dimensional models are supported.")
+            for d, split in enumerate(tree["splits"]):
+                if split.get("split_type") != "FloatFeature":
+                    raise ValueError(f"Unsupported split type '{split.get('split_type')}'.")
+                key = (split["float_feature_index"], float(np.float32(split["border"])))
+                tree_splits[t, d] = split_ids.setdefault(key, len(split_ids))
+            leaf_values[t] = tree["leaf_values"]
+
+        keys = list(split_ids)
+        n_features = len(exported["features_info"]["float_features"])
+        scale, biases = exported.get("scale_and_bias", [1.0, [0.0]])
+        return cls(np.array([k[0] for k in keys], dtype=np.int64), np.array([k[1] for k in keys]),
+                   tree_splits, leaf_values, scale, biases[0] if biases else 0.0, n_features)
+
+    # --- Evaluation ---
+
+    def predict_active(self, rows: np.ndarray, columns: np.ndarray, values: np.ndarray, n_rows: int) -> np.ndarray:
+        """
+        Scores 'n_rows' rows given only their non-zero entries: row[rows[i]] has
+        value values[i] in column columns[i]; every other feature is 0.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        predictions = np.empty(n_rows, dtype=np.float64)
+        # Entries are processed per block of rows; they need not be sorted
+        order = np.argsort(rows, kind='stable')
+        rows, columns, values = rows[order], columns[order], values[order]
+        bounds = np.searchsorted(rows, np.arange(0, n_rows + ROW_BLOCK, ROW_BLOCK))
+        for block, start in enumerate(range(0, n_rows, ROW_BLOCK)):
+            lo, hi = bounds[block], bounds[block + 1]
+            predictions[start:start + ROW_BLOCK] = self._predict_block(
+                rows[lo:hi] - start, columns[lo:hi], values[lo:hi], min(ROW_BLOCK, n_rows - start))
+        return predictions
+
+    def _predict_block(self, rows, columns, values, n_rows: int) -> np.ndarray:
+        # Split bits as (splits x rows) bytes, so the gathers below copy whole contiguous rows
+        bits = np.repeat(self.zero_bits.view(np.uint8)[:, None], n_rows, axis=1)
+        # Expand each active entry into the splits on its feature
+        starts = self.split_offsets[columns]
+        counts = self.split_offsets[columns + 1] - starts
+        total = int(counts.sum())
+        if total:
+            first = np.cumsum(counts) - counts
+            split_ids = np.repeat(starts - first, counts) + np.arange(total)
+            bits[split_ids, np.repeat(rows, counts)] = np.repeat(values, counts) > self.split_borders[split_ids]
+
+        # Leaf index of every (tree, row): bit d is the tree's split d
+        leaf = (bits[self.tree_splits] * self.level_weights).sum(axis=1, dtype=np.int64)
+        totals = self.leaf_values[leaf + self.leaf_offsets[:, None]].sum(axis=0)
+        return self.scale * totals + self.bias
+
+    def predict(self, matrix) -> np.ndarray:
+        """Scores a dense (rows x features) matrix; only its non-zero entries are read."""
+        matrix = np.asarray(matrix)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {matrix.shape[1]}.")
+        rows, columns = np.nonzero(matrix)
+        return self.predict_active(rows, columns, matrix[rows, columns], matrix.shape[0])
+
+
+if __name__ == '__main__':
+    # Engine comparison on the shipped models. Run from the project root: python -m App.tree_engine
+    import time
+    from .model_loader import MODEL_TARGETS, load_model
+
+    rng = np.random.default_rng(0)
+    for target, (model_file, _) in MODEL_TARGETS.items():
+        model = load_model(model_file)
+        start = time.perf_counter()
+        ensemble = ObliviousTreeEnsemble.from_catboost(model)
+        print(f"{target}: exported {ensemble.n_trees} trees of depth {ensemble.depth}, "
+              f"{len(ensemble.split_borders)} distinct splits in {time.perf_counter() - start:.2f}s")
+        for n in (1, 100, 10000):
+            matrix = (rng.random((n, ensemble.n_features)) < 0.02).astype(np.float64)
+            matrix[:, :5] = rng.random((n, 5)) * 10**rng.integers(1, 6, 5)
+            timings = {}
+            for name, fn in (("catboost", model.predict), ("numpy", ensemble.predict)):
+                fn(matrix)
+                calls = max(3, 2000 // n)
+                start = time.perf_counter()
+                for _ in range(calls):
+                    result = fn(matrix)
+                timings[name] = ((time.perf_counter() - start) / calls, result)
+            max_diff = np.max(np.abs(timings["catboost"][1] - timings["numpy"][1]))
+            print(f"  rows={n:<6} catboost={timings['catboost'][0] * 1000:8.3f}ms  "
+                  f"numpy={timings['numpy'][0] * 1000:8.3f}ms  max |diff|={max_diff:.3g}")
@@ -0,0 +1,260 @@
+# benchmarks/hot_paths.py
+"""
+Offline benchmarks of the prediction API's hot paths, against the shipped
+Trained_models/ and metadata/.
+
+Run from the project root:
+    python -m benchmarks.hot_paths                      # full run, JSON on stdout
+    python -m benchmarks.hot_paths --quick -o run.json  # fewer repetitions
+    python -m benchmarks.hot_paths --compare base.json run.json
+
+Cases:
+  * preprocess  - legacy preprocess_input (DataFrame) and FeatureEncoder, batch sizes 1..10k
+  * predict     - model.predict alone for each target, batch sizes 1..10k, and the same
+                  batches through the NumPy tree evaluator (App/tree_engine.py)
+  * request     - full Flask requests through the test client: /predict_copies_sold at
+                  several concurrency levels and /predict_copies_sold/batch for each batch size
+  * log         - log_prediction / log_predictions on a copy of the real database.db,
+                  synchronously and through the background writer
+  * db          - requests that use the request-scoped SQLite connection (history and
+                  roll-up queries, a prediction logged synchronously) at several concurrency levels,
+                  with a connection per app context (unpooled) and from the pool (pooled)
+
+Each case reports p50/p95/p99/mean latency per call and rows/sec, so runs
+from different commits can be compared with --compare.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+CONCURRENCY_LEVELS = [1, 4, 16]
+SEED = 0
+
+
+# --- Measurement helpers ---
+
+def summarize(latencies: list, rows_per_call: int, wall_seconds: float) -> dict:
+    latencies = sorted(latencies)
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 4)
+    return {
+        "calls": len(latencies),
+        "rows_per_call": rows_per_call,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+        "rows_per_sec": round(len(latencies) * rows_per_call / wall_seconds, 1)
+    }
+
+def measure(fn, args_list: list, rows_per_call: int, concurrency: int = 1, warmup: int = 2) -> dict:
+    """Calls fn(*args) for every entry of 'args_list' from 'concurrency' threads."""
+    for args in args_list[:warmup]:
+        fn(*args)
+    latencies = []
+    def timed(args):
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    wall_start = time.perf_counter()
+    if concurrency == 1:
+        for args in args_list:
+            timed(args)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, args_list))
+    return summarize(latencies, rows_per_call, time.perf_counter() - wall_start)
+
+def repeats_for(batch_size: int, scale: float) -> int:
+    """Fewer calls for large batches so every case takes a similar time."""
+    return max(3, int(min(300, 20000 / batch_size) * scale))
+
+
+# --- Inputs ---
+
+def random_records(metadata: dict, count: int, rng: random.Random) -> list:
+    # The first entry of most metadata lists is the CSV header; skip it
+    tags, genres = metadata['tags'][1:], metadata['genres'][1:]
+    categories, publishers = metadata['categories'], metadata['publishers'][1:]
+    return [{
+        "time_to_beat": round(rng.uniform(1, 200), 1),
+        "price": round(rng.uniform(0, 60), 2),
+        "followers": rng.randint(0, 10**6),
+        "engagement_ratio": round(rng.uniform(0, 5), 2),
+        "selected_tags": rng.sample(tags, rng.randint(1, 8)),
+        "selected_genres": rng.sample(genres, rng.randint(1, 3)),
+        "selected_categories": rng.sample(categories, rng.randint(1, 4)),
+        "selected_publisher": rng.choice(publishers)
+    } for _ in range(count)]
+
+
+# --- Benchmark run ---
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run(scale: float) -> dict:
+    # Benchmark against a copy of the real database so runs don't grow it
+    work_dir = tempfile.mkdtemp(prefix='bench_')
+    db_path = os.path.join(work_dir, 'database.db')
+    if os.path.exists('database.db'):
+        shutil.copy('database.db', db_path)
+    os.environ.setdefault('PREDICTION_CACHE_SIZE', '0') # Measure inference, not cache hits
+    from App import database
+    database.DATABASE = db_path
+    import App.main as app_main
+    from App.preprocessing import preprocess_input
+    from App.model_loader import build_tree_evaluator
+
+    metadata = app_main.LOADED_METADATA
+    encoder = app_main.LOADED_ENCODER
+    client = app_main.app.test_client()
+    rng = random.Random(SEED)
+    records = random_records(metadata, max(BATCH_SIZES), rng)
+    results = {"preprocess": {}, "predict": {}, "request": {}, "log": {}, "db": {}}
+
+    # preprocess
+    calls = repeats_for(1, scale)
+    results["preprocess"]["legacy_dataframe_1"] = measure(
+        lambda r: preprocess_input(r, metadata), [(r,) for r in records[:calls]], 1)
+    results["preprocess"]["encoder_1"] = measure(encoder.encode, [(r,) for r in records[:calls]], 1)
+    for n in BATCH_SIZES[1:]:
+        results["preprocess"][f"encoder_batch_{n}"] = measure(
+            encoder.encode_batch, [(records[:n],)] * repeats_for(n, scale), n)
+
+    # predict
+    full_matrix, _, _ = encoder.encode_batch(records)
+    for target in app_main.MODEL_TARGETS:
+        model = app_main.get_model_entry(target)["model"]
+        evaluator = build_tree_evaluator(model)
+        for n in BATCH_SIZES:
+            calls = repeats_for(n, scale)
+            batches = [(full_matrix[i % (len(records) - n + 1):][:n],) for i in range(calls)]
+            results["predict"][f"{target}_{n}"] = measure(model.predict, batches, n)
+            if evaluator is not None:
+                results["predict"][f"{target}_numpy_{n}"] = measure(evaluator.predict, batches, n)
+
+    # request
+    def post_single(record):
+        response = app_main.app.test_client().post('/predict_copies_sold', json=record)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    for concurrency in CONCURRENCY_LEVELS:
+        calls = repeats_for(1, scale) * concurrency
+        results["request"][f"predict_copies_sold_c{concurrency}"] = measure(
+            post_single, [(records[i % len(records)],) for i in range(calls)], 1, concurrency)
+    def post_batch(batch):
+        response = client.post('/predict_copies_sold/batch', json=batch)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    for n in BATCH_SIZES:
+        results["request"][f"batch_{n}"] = measure(post_batch, [(records[:n],)] * repeats_for(n, scale), n)
+
+    # log
+    writer, database.LOG_WRITER = database.LOG_WRITER, None
+    with app_main.app.app_context():
+        calls = repeats_for(1, scale)
+        results["log"]["log_prediction_sync"] = measure(
+            lambda r: database.log_prediction(r, 1.0, "copies_sold", "bench"), [(r,) for r in records[:calls]], 1)
+        for n in BATCH_SIZES[1:]:
+            rows = [(r, 1.0, "copies_sold", "bench") for r in records[:n]]
+            results["log"][f"log_predictions_sync_{n}"] = measure(
+                database.log_predictions, [(rows,)] * repeats_for(n, scale), n)
+    database.LOG_WRITER = writer
+    if writer is not None:
+        calls = repeats_for(1, scale)
+        results["log"]["log_prediction_enqueue"] = measure(
+            lambda r: database.log_prediction(r, 1.0, "copies_sold", "bench"), [(r,) for r in records[:calls]], 1)
+        start = time.perf_counter()
+        writer.flush()
+        results["log"]["writer_drain_seconds"] = round(time.perf_counter() - start, 4)
+
+    # db: one request mix per call, so rows/sec is requests/sec
+    paths = ['/predictions?limit=20', '/predictions?model=copies_sold&limit=20', '/predictions/rollups?limit=20']
+    admin_token = app_main.ADMIN_TOKEN
+    app_main.ADMIN_TOKEN = admin_token or 'benchmark' # /predictions is an admin endpoint
+    def db_requests(record):
+        client = app_main.app.test_client()
+        for path in paths:
+            response = client.get(path, headers={'X-Admin-Token': app_main.ADMIN_TOKEN})
+            assert response.status_code == 200, response.get_data(as_text=True)
+        response = client.post('/predict/wishlists', json=record)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    writer, database.LOG_WRITER = database.LOG_WRITER, None # Log inside the request, on its connection
+    pool_size = database.DB_POOL.size
+    for mode, size in (("unpooled", 0), ("pooled", pool_size or database.POOL_SIZE)):
+        database.init_pool(size)
+        for concurrency in CONCURRENCY_LEVELS:
+            calls = max(concurrency, repeats_for(1, scale) // 2) * concurrency
+            results["db"][f"{mode}_c{concurrency}"] = measure(
+                db_requests, [(records[i % len(records)],) for i in range(calls)], len(paths) + 1, concurrency)
+    database.init_pool(pool_size)
+    database.LOG_WRITER = writer
+    app_main.ADMIN_TOKEN = admin_token
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def compare(base: dict, current: dict) -> list:
+    """Rows of (case, base p50, current p50, p50 ratio, rows/sec ratio) for cases in both runs."""
+    rows = []
+    for group, cases in current["results"].items():
+        for case, stats in cases.items():
+            old = base["results"].get(group, {}).get(case)
+            if not isinstance(stats, dict) or not isinstance(old, dict):
+                continue
+            rows.append((f"{group}/{case}", old["p50_ms"], stats["p50_ms"],
+                         round(stats["p50_ms"] / old["p50_ms"], 3) if old["p50_ms"] else None,
+                         round(stats["rows_per_sec"] / old["rows_per_sec"], 3) if old["rows_per_sec"] else None))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--quick', action='store_true', help="Run a tenth of the repetitions")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'CURRENT'), help="Compare two JSON reports")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        print(f"{'case':<45} {'base p50':>10} {'now p50':>10} {'p50 x':>7} {'rows/s x':>9}")
+        for case, old_p50, new_p50, p50_ratio, rps_ratio in compare(base, current):
+            print(f"{case:<45} {old_p50:>10.3f} {new_p50:>10.3f} {p50_ratio:>7} {rps_ratio:>9}")
+        return
+
+    # App and encoder messages go to stderr; stdout carries only the report
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(0.1 if args.quick else 1.0)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "quick": args.quick,
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
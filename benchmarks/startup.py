@@ -0,0 +1,146 @@
+# benchmarks/startup.py
+"""
+Cold-start time and per-worker memory of the API.
+
+Run from the project root:  python -m benchmarks.startup [--workers N]
+
+Reports, as JSON on stdout:
+  * model load time and RSS growth for the pickled vs native (.cbm) models,
+  * time to import App.main (full app startup),
+  * private and proportional (PSS) memory per forked worker, with the app
+    preloaded in the parent (gunicorn --preload) vs loaded in each worker.
+"""
+import argparse
+import gc
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODEL_FILES = [
+    'catboost_model_Copies Sold.pkl',
+    'catboost_model_Wishlists.pkl',
+    'catboost_model_bayesian_score.pkl'
+]
+
+
+def rss_kb(pid: str = 'self') -> int:
+    """Resident set size of a process in kB (Linux only)."""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def smaps_kb(pid: int) -> dict:
+    """Private and proportional memory of a process in kB (Linux only)."""
+    totals = {'Pss': 0, 'Private_Clean': 0, 'Private_Dirty': 0}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key = line.split(':')[0]
+            if key in totals:
+                totals[key] = int(line.split()[1])
+    return {'pss_kb': totals['Pss'], 'private_kb': totals['Private_Clean'] + totals['Private_Dirty']}
+
+
+def run_child(mode: str, env_overrides: dict, workers: int) -> dict:
+    """Runs this script in a fresh interpreter for one measurement."""
+    env = dict(os.environ, **env_overrides)
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup', '--child', mode, '--workers', str(workers)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def child_load_models() -> dict:
+    importlib.import_module('catboost') # Import cost is shared by both formats; keep it out of the timing
+    from App.model_loader import load_model, resolve_model_path
+    rss_before = rss_kb()
+    start = time.perf_counter()
+    paths = []
+    for model_file in MODEL_FILES:
+        load_model(model_file)
+        paths.append(resolve_model_path(model_file))
+    return {
+        'seconds': round(time.perf_counter() - start, 4),
+        'rss_growth_kb': rss_kb() - rss_before,
+        'files': [os.path.basename(p) for p in paths]
+    }
+
+
+def child_import_app() -> dict:
+    start = time.perf_counter()
+    importlib.import_module('App.main')
+    return {'seconds': round(time.perf_counter() - start, 4), 'rss_kb': rss_kb()}
+
+
+def child_workers(preload: bool, workers: int) -> dict:
+    def serve_one():
+        import App.main as app_main
+        app_main.predict_single(list(app_main.MODEL_TARGETS), {'price': 9.99, 'selected_tags': ['Action']})
+
+    if preload:
+        importlib.import_module('App.main')
+        gc.freeze() # Same as the gunicorn config: keep the GC from dirtying shared pages
+
+    pids = []
+    ready_r, ready_w = os.pipe()
+    go_r, go_w = os.pipe()
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            serve_one()
+            os.write(ready_w, b'.')
+            os.read(go_r, 1) # Stay alive until the parent has measured us
+            os._exit(0)
+        pids.append(pid)
+    for _ in pids:
+        os.read(ready_r, 1)
+    per_worker = [smaps_kb(pid) for pid in pids]
+    os.write(go_w, b'.' * workers)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return {
+        'workers': workers,
+        'mean_private_kb': sum(w['private_kb'] for w in per_worker) // workers,
+        'mean_pss_kb': sum(w['pss_kb'] for w in per_worker) // workers
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Startup logging goes to stderr so stdout carries only the result line
+        real_stdout = sys.stdout
+        sys.stdout = sys.stderr
+        if args.child == 'load':
+            result = child_load_models()
+        elif args.child == 'import':
+            result = child_import_app()
+        else:
+            result = child_workers(args.child == 'preload', args.workers)
+        print(json.dumps(result), file=real_stdout)
+        return
+
+    report = {
+        'load_pickle': run_child('load', {'PREFER_NATIVE_MODEL_FORMAT': '0'}, args.workers),
+        'load_native': run_child('load', {'PREFER_NATIVE_MODEL_FORMAT': '1'}, args.workers),
+        'import_app_main': run_child('import', {}, args.workers),
+        'workers_preloaded': run_child('preload', {}, args.workers),
+        'workers_loaded_per_worker': run_child('per-worker', {}, args.workers)
+    }
+    if not any(f.endswith('.cbm') for f in report['load_native']['files']):
+        report['note'] = "No .cbm models found; run 'python -m App.model_loader --convert' first."
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
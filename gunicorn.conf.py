@@ -0,0 +1,20 @@
+# gunicorn.conf.py
+# Used by the Dockerfile: gunicorn -c gunicorn.conf.py App.main:app
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+
+# Import App.main (models, metadata, DB setup) once in the master and fork the
+# workers from it, so they share the model memory copy-on-write instead of
+# each loading its own copy. Set GUNICORN_PRELOAD=0 to load per worker.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    # Move everything allocated during preload out of the GC's tracked
+    # generations, so collections in the workers don't write to (and so
+    # un-share) those pages.
+    if preload_app:
+        gc.freeze()
@@ -0,0 +1,85 @@
+# tests/test_database.py
+"""Run from the project root: python -m pytest tests"""
+import json
+import sqlite3
+
+import pytest
+
+from App import database
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'predictions.db'))
+    return database.DATABASE
+
+
+def features(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute("SELECT prediction_id, kind, value FROM prediction_features"))
+    finally:
+        conn.close()
+
+
+def test_log_writer_writes_prediction_features(db_path):
+    database.init_db()
+    writer = database.PredictionLogWriter()
+    writer.start()
+    writer.enqueue([({"selected_tags": ["Action", "Action", 3], "selected_genres": ["Indie"]}, 1.0, "copies_sold", "v1")])
+    assert writer.enqueue_batch([({"selected_categories": ["Co-op"], "selected_publisher": "AAA"}, 2.0, "wishlists", "v1"),
+                                 ("not a dict", 3.0, "wishlists", "v1")])
+    writer.stop()
+    assert writer.stats()["written"] == 3
+    assert features(db_path) == [(1, 'genre', 'Indie'), (1, 'tag', 'Action'), (2, 'category', 'Co-op')]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0] == 0
+    assert conn.execute("SELECT publisher FROM predictions WHERE id = 2").fetchone()[0] == "AAA"
+    conn.close()
+
+
+def test_history_migration_resumes_after_interruption(db_path, monkeypatch):
+    # A database from before the history index: original columns only
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE predictions (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                 "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, input_data TEXT, prediction REAL)")
+    conn.executemany("INSERT INTO predictions (input_data, prediction) VALUES (?, ?)",
+                     [(json.dumps({"selected_tags": [f"tag{i}"], "selected_publisher": "AAA"}), float(i))
+                      for i in range(1, 11)] + [("not json", 0.0)])
+    # Interrupt the chunk holding id 7
+    conn.execute("CREATE TABLE prediction_features (kind TEXT NOT NULL, value TEXT NOT NULL, "
+                 "prediction_id INTEGER NOT NULL, PRIMARY KEY (kind, value, prediction_id)) WITHOUT ROWID")
+    conn.execute("CREATE TRIGGER fail_migration BEFORE INSERT ON prediction_features WHEN NEW.prediction_id = 7 "
+                 "BEGIN SELECT RAISE(ABORT, 'interrupted'); END")
+    conn.commit()
+    migrate_history = database.migrate_history
+    monkeypatch.setattr(database, 'migrate_history', lambda conn: migrate_history(conn, chunk_size=3))
+
+    with pytest.raises(sqlite3.IntegrityError):
+        database.init_db()
+    assert conn.execute("SELECT last_id, target_id FROM schema_migrations").fetchone() == (6, 11)
+    assert [row[0] for row in features(db_path)] == [1, 2, 3, 4, 5, 6]
+
+    conn.execute("DROP TRIGGER fail_migration")
+    conn.commit()
+    database.init_db()
+    assert conn.execute("SELECT last_id, target_id FROM schema_migrations").fetchone() == (11, 11)
+    assert features(db_path) == [(i, 'tag', f"tag{i}") for i in range(1, 11)]
+    assert conn.execute("SELECT COUNT(*) FROM predictions WHERE publisher = 'AAA'").fetchone()[0] == 10
+    conn.close()
+
+
+@pytest.mark.parametrize("until, expected", [
+    ('2024-05-01', [1, 2]),            # Date only: the whole day
+    ('2024-05-01T12:00:00', [1]),
+    ('2024-05-01T10:00:00Z', [1])
+])
+def test_until_is_inclusive(db_path, until, expected):
+    database.init_db()
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO predictions (timestamp, input_data, prediction) VALUES (?, '{}', 1.0)",
+                     [('2024-05-01 10:00:00',), ('2024-05-01 23:59:59',), ('2024-05-02 00:00:00',)])
+    where, params = database._history_filters({'until': until})
+    ids = [row[0] for row in conn.execute(f"SELECT p.id FROM predictions AS p{where} ORDER BY p.id", params)]
+    conn.close()
+    assert ids == expected
@@ -0,0 +1,80 @@
+# tests/test_model_reload.py
+"""Run from the project root: python -m pytest tests"""
+import json
+
+import joblib
+import numpy as np
+import pytest
+
+from App import model_loader
+from App.model_reload import ModelReloader, ReloadInProgress
+
+FEATURES = ['time_to_beat', 'Price', 'Followers', 'engagement_ratio', 'Unnamed: 0', 'Tags_Action']
+
+
+class ConstantModel:
+    """Stands in for a CatBoost regressor: feature_names_ and predict."""
+
+    def __init__(self, value, feature_names=FEATURES):
+        self.value = value
+        self.feature_names_ = list(feature_names)
+
+    def predict(self, matrix):
+        return np.full(len(matrix), self.value)
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_loader, 'MODELS_DIR', str(tmp_path))
+    monkeypatch.setattr(model_loader, 'INFERENCE_ENGINE', 'catboost')
+    saved = dict(model_loader.MODEL_REGISTRY)
+    model_loader.MODEL_REGISTRY.clear()
+    joblib.dump(ConstantModel(1.0), tmp_path / 'current.pkl')
+    model_loader.load_model('current.pkl', target='copies_sold')
+    yield tmp_path
+    model_loader.MODEL_REGISTRY.clear()
+    model_loader.MODEL_REGISTRY.update(saved)
+
+
+def served_value():
+    return model_loader.get_model_entry('copies_sold')["model"].value
+
+
+def test_valid_model_is_swapped_in_and_recorded(models_dir):
+    joblib.dump(ConstantModel(2.0), models_dir / 'new.pkl')
+    control_file = models_dir / 'reload_requests.json'
+    reloader = ModelReloader(FEATURES, control_file=str(control_file))
+    entry, generation = reloader.request_reload('copies_sold', 'new.pkl')
+    assert served_value() == 2.0 and entry["model_name"] == 'new.pkl'
+    assert json.loads(control_file.read_text()) == {'copies_sold': {'model_name': 'new.pkl', 'generation': 1}}
+    assert generation == reloader.status()['copies_sold']['reload_generation'] == 1
+
+    # Another worker (or a restart) applies the recorded reload
+    model_loader.load_model('current.pkl', target='copies_sold')
+    ModelReloader(FEATURES, control_file=str(control_file))
+    assert served_value() == 2.0
+
+
+@pytest.mark.parametrize("model_name, model", [
+    ('permuted.pkl', ConstantModel(2.0, FEATURES[::-1])), # Same width, other column order
+    ('nan.pkl', ConstantModel(float('nan'))),
+    ('missing.pkl', None)
+])
+def test_rejected_model_keeps_serving_and_is_not_recorded(models_dir, model_name, model):
+    if model is not None:
+        joblib.dump(model, models_dir / model_name)
+    control_file = models_dir / 'reload_requests.json'
+    reloader = ModelReloader(FEATURES, control_file=str(control_file))
+    with pytest.raises(Exception):
+        reloader.request_reload('copies_sold', model_name)
+    assert served_value() == 1.0
+    assert not control_file.exists()
+    assert model_name in reloader.status()['copies_sold']['last_error']
+    assert not reloader.is_reloading('copies_sold')
+
+
+def test_concurrent_reload_is_refused(models_dir):
+    reloader = ModelReloader(FEATURES)
+    reloader._reloading.add('copies_sold') # A reload already running in this process
+    with pytest.raises(ReloadInProgress):
+        reloader.request_reload('copies_sold')
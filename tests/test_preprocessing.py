@@ -0,0 +1,33 @@
+# tests/test_preprocessing.py
+"""Run from the project root: python -m pytest tests"""
+import pytest
+
+from App.preprocessing import FeatureEncoder
+
+METADATA = {
+    'feature_columns': ['time_to_beat', 'Price', 'Followers', 'engagement_ratio',
+                        'Publishers Class_AAA', 'Tags_Action', 'genres_Indie'],
+    'tags': ['Action'],
+    'genres': ['Indie'],
+    'categories': [],
+    'publishers': ['AAA']
+}
+
+
+@pytest.mark.parametrize("publisher", [["AAA"], {"a": 1}])
+def test_unhashable_publisher_is_not_cacheable_but_encodes(publisher):
+    encoder = FeatureEncoder(METADATA)
+    raw_input = {"price": 9.99, "selected_publisher": publisher, "selected_tags": ["Action"]}
+    # predict_single treats TypeError as "bypass the cache"
+    with pytest.raises(TypeError):
+        encoder.canonical_key(raw_input)
+    row = encoder.encode(raw_input)[0]
+    assert row[1] == 9.99 and row[5] == 1.0
+    assert row[4] == 0.0 # Unknown publisher, not encoded
+
+
+def test_canonical_key_is_hashable_and_order_insensitive():
+    encoder = FeatureEncoder(METADATA)
+    first = encoder.canonical_key({"selected_publisher": "AAA", "selected_tags": ["Action", "Action"]})
+    second = encoder.canonical_key({"selected_publisher": "AAA", "selected_tags": ["Action"]})
+    assert hash(first) == hash(second) and first == second
@@ -0,0 +1,132 @@
+# tests/test_retention.py
+"""Run from the project root: python -m pytest tests"""
+import sqlite3
+
+import flask
+import pytest
+
+from App import database, retention
+
+OLD_DAY = '2020-01-01'
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'predictions.db'))
+    database.init_db()
+    conn = database.configure_connection(sqlite3.connect(database.DATABASE))
+    conn.isolation_level = None # Explicit transactions, as in run_retention
+    yield conn
+    conn.close()
+
+
+def log_rows(conn, rows):
+    """Logs (hour, input_data, prediction, model) rows on OLD_DAY through the writers' insert path."""
+    conn.execute("BEGIN")
+    database._insert_predictions(conn.cursor(), [(f"{OLD_DAY} {hour:02d}:00:00", input_data, prediction, model, 'v1')
+                                                 for hour, input_data, prediction, model in rows])
+    conn.execute("COMMIT")
+
+
+def sample_rows():
+    rows = []
+    for i in range(12):
+        input_data = {"selected_publisher": "AAA" if i % 2 else "BBB", "selected_genres": ["Indie"] if i % 3 else []}
+        rows.append((i, input_data, None if i % 4 == 0 else float(i), 'copies_sold'))
+    return rows
+
+
+def archive_rows(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'archive' / f"predictions-{OLD_DAY[:7]}.db"))
+    try:
+        return conn.execute("SELECT id, input_data, prediction FROM predictions ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_rollup_skips_null_predictions(db):
+    log_rows(db, sample_rows() + [(0, {"selected_publisher": "CCC"}, None, 'copies_sold')])
+    period, start, end = retention.period_bounds(f"{OLD_DAY} 00:00:00", 'day')
+    assert retention.rollup_period(db, 'day', period, start, end) == 13
+    rollups = {(dimension, value): (count, mean, p50) for dimension, value, count, mean, p50 in db.execute(
+        "SELECT dimension, value, count, mean, p50 FROM prediction_rollups WHERE model = 'copies_sold'")}
+    values = [float(i) for i in range(12) if i % 4]
+    assert rollups[('all', '')][:2] == (len(values), pytest.approx(sum(values) / len(values)))
+    assert rollups[('publisher', 'CCC')] == (0, None, None) # Only NULL predictions
+    assert rollups[('genre', 'Indie')][0] == len([i for i in range(12) if i % 3 and i % 4])
+    # A period is rolled up only once
+    assert retention.rollup_period(db, 'day', period, start, end) == 0
+
+
+def test_rollup_then_purge_archives_every_row(db, tmp_path):
+    log_rows(db, sample_rows())
+    logged = db.execute("SELECT id, input_data, prediction FROM predictions ORDER BY id").fetchall()
+    summary = retention.run_retention(retention_days=1, archive_dir=str(tmp_path / 'archive'), chunk_size=5, pause=0)
+    assert summary["rolled_up"] == summary["purged"] == len(logged)
+    assert db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM prediction_features").fetchone()[0] == 0
+    assert archive_rows(tmp_path) == logged # NULL predictions included
+    assert db.execute("SELECT purged_at IS NOT NULL FROM retention_periods").fetchone()[0] == 1
+
+
+def test_purge_resumes_after_an_interrupted_chunk(db, tmp_path):
+    log_rows(db, sample_rows())
+    logged = db.execute("SELECT id, input_data, prediction FROM predictions ORDER BY id").fetchall()
+    archive_dir = str(tmp_path / 'archive')
+    start, end = f"{OLD_DAY} 00:00:00", '2020-01-02 00:00:00'
+    # Fail the third chunk's delete, after its rows were copied to the archive
+    db.execute("CREATE TEMP TRIGGER fail_delete BEFORE DELETE ON predictions WHEN OLD.id = 11 "
+               "BEGIN SELECT RAISE(ABORT, 'interrupted'); END")
+    with pytest.raises(sqlite3.IntegrityError):
+        retention.purge_period(db, start, end, archive_dir, chunk_size=5, pause=0)
+    assert db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] == 2
+    db.execute("DROP TRIGGER fail_delete")
+
+    assert retention.purge_period(db, start, end, archive_dir, chunk_size=5, pause=0) == 2
+    assert archive_rows(tmp_path) == logged
+
+
+def test_purge_skips_rows_already_archived(db, tmp_path):
+    """A chunk whose archive write committed without its deletes (WAL) is not copied twice."""
+    log_rows(db, sample_rows())
+    logged = db.execute("SELECT id, input_data, prediction FROM predictions ORDER BY id").fetchall()
+    archive_dir = tmp_path / 'archive'
+    archive_dir.mkdir()
+    archive = sqlite3.connect(str(archive_dir / f"predictions-{OLD_DAY[:7]}.db"))
+    archive.execute(retention.ARCHIVE_TABLE_SQL.format(name="predictions"))
+    archive.execute(f"INSERT INTO predictions ({retention.ARCHIVE_COLUMNS}) VALUES (1, ?, ?, ?, 'copies_sold', 'v1', NULL)",
+                    (f"{OLD_DAY} 00:00:00", logged[0][1], logged[0][2]))
+    archive.commit()
+    archive.close()
+
+    purged = retention.purge_period(db, f"{OLD_DAY} 00:00:00", '2020-01-02 00:00:00', str(archive_dir), chunk_size=5, pause=0)
+    assert purged == len(logged)
+    assert archive_rows(tmp_path) == logged
+
+
+def test_archive_with_not_null_columns_is_rebuilt(db, tmp_path):
+    archive_dir = tmp_path / 'archive'
+    archive_dir.mkdir()
+    archive = sqlite3.connect(str(archive_dir / f"predictions-{OLD_DAY[:7]}.db"))
+    archive.execute("CREATE TABLE predictions (id INTEGER PRIMARY KEY, timestamp DATETIME, input_data TEXT NOT NULL, "
+                    "prediction REAL NOT NULL, model TEXT, model_version TEXT, publisher TEXT)")
+    archive.execute("INSERT INTO predictions VALUES (1000, '2019-12-31 00:00:00', '{}', 1.0, 'copies_sold', 'v0', NULL)")
+    archive.commit()
+    archive.close()
+    log_rows(db, sample_rows())
+
+    retention.purge_period(db, f"{OLD_DAY} 00:00:00", '2020-01-02 00:00:00', str(archive_dir), chunk_size=5, pause=0)
+    rows = archive_rows(tmp_path)
+    assert len(rows) == 13 and rows[-1][0] == 1000
+    assert sum(prediction is None for _, _, prediction in rows) == 3
+
+
+def test_rollup_until_includes_the_hours_of_that_day(db):
+    log_rows(db, sample_rows())
+    for hour in range(12):
+        period, start, end = retention.period_bounds(f"{OLD_DAY} {hour:02d}:00:00", 'hour')
+        retention.rollup_period(db, 'hour', period, start, end)
+    with flask.Flask(__name__).app_context():
+        periods = {row["period"] for row in database.query_rollups(granularity='hour', dimension='all', until=OLD_DAY)}
+        assert len(periods) == 12
+        assert database.query_rollups(until='2019-12-31') == []